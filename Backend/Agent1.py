@@ -1,11 +1,5 @@
-
-from neo4j import GraphDatabase
 from xml.dom import minidom
-
-# --- Neo4j Configuration ---
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = "neo4j"
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+import neo4j_client as db
 
 # --- KML File Path ---
 KML_FILE = "bengaluru-traffic-police.kml"  # Ensure this file is in the same directory
@@ -66,8 +60,7 @@ def create_jurisdiction(tx, data):
 
 def main():
     jurisdictions = extract_jurisdictions(KML_FILE)
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-    with driver.session() as session:
+    with db.session() as session:
         for j in jurisdictions:
             session.execute_write(create_jurisdiction, j)
     print(f"✅ Ingested {len(jurisdictions)} jurisdictions into Neo4j.")
@@ -1,17 +1,11 @@
 import xml.etree.ElementTree as ET
 import pandas as pd
 from shapely.geometry import Polygon
-from py2neo import Graph, Node, Relationship
-import os
+import neo4j_client as db
+
 # === Config ===
 WARD_KML_PATH = "bbmp_final_new_wards.kml"
 WARD_MAPPING_CSV = "ward_to_traffic_jurisdiction.csv"
-# NEO4J_URI = "bolt://localhost:7687"
-# NEO4J_USER = "neo4j"
-# NEO4J_PASSWORD = "password"
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = "neo4j"
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 
 # === Parse ward KML and extract properties ===
 def extract_wards_with_properties(kml_path):
@@ -46,6 +40,15 @@ def extract_wards_with_properties(kml_path):
 
     return wards
 
+def merge_wards(tx, rows):
+    tx.run("""
+        UNWIND $rows AS row
+        MERGE (w:Ward {name: row.name})
+        SET w += row.props
+        MERGE (j:TrafficJurisdiction {name: row.jurisdiction})
+        MERGE (w)-[:BELONGS_TO]->(j)
+    """, rows=rows)
+
 # === Main Logic ===
 def main():
     # Load mapping CSV
@@ -55,10 +58,7 @@ def main():
     # Load ward data with all properties
     wards = extract_wards_with_properties(WARD_KML_PATH)
 
-    # Connect to Neo4j
-    graph = Graph(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-
-    # Create nodes and relationships
+    rows = []
     for ward in wards:
         ward_name = ward.get("proposed_ward_name_en")
         if not ward_name:
@@ -69,19 +69,11 @@ def main():
             print(f"⚠️ No jurisdiction mapping found for ward: {ward_name}")
             continue
 
-        # Create/merge Ward node with all its properties
-        ward_node = Node("Ward", name=ward_name, **ward)
-
-        # Ensure Jurisdiction node exists
-        jurisdiction_node = graph.nodes.match("TrafficJurisdiction", name=jurisdiction_name).first()
-        if not jurisdiction_node:
-            jurisdiction_node = Node("TrafficJurisdiction", name=jurisdiction_name)
-            graph.create(jurisdiction_node)
+        rows.append({"name": ward_name, "jurisdiction": jurisdiction_name, "props": ward})
 
-        # Merge and relate
-        graph.merge(ward_node, "Ward", "name")
-        rel = Relationship(ward_node, "BELONGS_TO", jurisdiction_node)
-        graph.merge(rel)
+    # Merge all wards and their BELONGS_TO relationships in one transaction
+    db.write(merge_wards, rows)
+    db.close()
 
     print("✅ Wards and BELONGS_TO relationships loaded into Neo4j.")
 
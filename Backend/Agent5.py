@@ -1,97 +1,136 @@
 import json
+import hashlib
 import logging
-from py2neo import Graph, Node, Relationship
-import os
+from concurrent.futures import ThreadPoolExecutor
+import neo4j_client as db
+from graph_schema import ensure_schema
+from graph_queries import CONTAINERS_QUERY, INCIDENTS_QUERY, ABSORBED_QUERY
+
 # CONFIG
 INPUT_FILE = "bengaluru_events_24h1.json"
-# NEO4J_URI = "bolt://localhost:7687"
-# NEO4J_USER = "neo4j"
-# NEO4J_PASSWORD = "password"
 CITY_NAME = "Bengaluru"
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = "neo4j"
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+BATCH_SIZE = 500
 
 logging.basicConfig(level=logging.INFO)
-graph = Graph(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-
-def ensure_city():
-    city = graph.nodes.match("City", name=CITY_NAME).first()
-    if not city:
-        city = Node("City", name=CITY_NAME)
-        graph.create(city)
-    return city
-
-def ensure_jurisdiction(jname, city_node):
-    jur = graph.nodes.match("TrafficJurisdiction", name=jname).first()
-    if not jur:
-        jur = Node("TrafficJurisdiction", name=jname)
-        graph.create(jur)
-        graph.create(Relationship(jur, "PART_OF", city_node))
-    return jur
-
-def ensure_container(jurisdiction):
-    container = graph.nodes.match("Incidents", jurisdiction=jurisdiction).first()
-    if not container:
-        container = Node("Incidents", jurisdiction=jurisdiction)
-        graph.create(container)
-    return container
-
-def link_container(holder, container):
-    rel = Relationship(holder, "HAS_CONTAINER", container)
-    graph.merge(rel)
-
-def insert_incident(event, container_node):
-    incident = Node("Incident", **event)
-    graph.create(incident)
-    graph.create(Relationship(container_node, "HAS_INCIDENT", incident))
-
-def ingest():
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        events = json.load(f)
-
-    city = ensure_city()
 
+def content_hash(event):
+    payload = json.dumps(event, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def prepare_event(event):
+    """Normalize jurisdiction in place; returns None for events that cannot be keyed."""
+    if not event.get("id"):
+        return None
+    jurisdiction = event.get("jurisdiction") or "Unknown"
+    event["jurisdiction"] = jurisdiction.strip()
+    return event
+
+def dedupe_events(events):
+    """Prepare events and keep the last version of each id, in first-seen order."""
+    by_id = {}
     for event in events:
-        jurisdiction = event.get("jurisdiction") or "Unknown"
-        jurisdiction = jurisdiction.strip()
-        event["jurisdiction"] = jurisdiction
-
-        if jurisdiction == "Unknown":
-            container = ensure_container("Unknown")
-            link_container(city, container)
+        if prepare_event(event):
+            by_id[event["id"]] = event
         else:
-            jur_node = ensure_jurisdiction(jurisdiction, city)
-            container = ensure_container(jurisdiction)
-            link_container(jur_node, container)
-
-        insert_incident(event, container)
-        logging.info(f"Inserted: {event['id']} into {jurisdiction}")
-
-    logging.info("✅ Done. All events inserted.")
-
-def ingestevents(events: list[dict]):
-    # with open(INPUT_FILE, "r", encoding="utf-8") as f:
-    #     events = json.load(f)
-
-    city = ensure_city()
+            logging.warning(f"⚠️ Skipping event without id: {event.get('title')}")
+    return list(by_id.values())
+
+def ensure_containers_batch(tx, jurisdictions):
+    """Create the City, jurisdictions and Incidents containers for many jurisdictions at once."""
+    tx.run(CONTAINERS_QUERY, city=CITY_NAME, jurisdictions=sorted(set(jurisdictions)))
+
+def upsert_incidents_batch(tx, events, ensure_containers=True, statuses=None):
+    """Upsert many prepared events inside transaction `tx`; returns status counts.
+    Events already absorbed into a cluster are skipped with status 'absorbed'.
+    If `statuses` is a dict, it is filled with id -> status."""
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "absorbed": 0}
+    if not events:
+        return counts
+    absorbed = {r["id"] for r in tx.run(ABSORBED_QUERY, ids=[e["id"] for e in events])}
+    if absorbed:
+        counts["absorbed"] = len(absorbed)
+        if statuses is not None:
+            statuses.update(dict.fromkeys(absorbed, "absorbed"))
+        events = [e for e in events if e["id"] not in absorbed]
+        if not events:
+            return counts
+    if ensure_containers:
+        ensure_containers_batch(tx, [e["jurisdiction"] for e in events])
+    rows = [{"props": e, "hash": content_hash(e)} for e in events]
+    for record in tx.run(INCIDENTS_QUERY, events=rows):
+        counts[record["status"]] += record["n"]
+        if statuses is not None:
+            statuses.update(dict.fromkeys(record["ids"], record["status"]))
+    return counts
 
+def ingest():
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        events = json.load(f)
+    return ingestevents(events)
+
+def ingestevents(events: list[dict]) -> dict:
+    ensure_schema()
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "absorbed": 0}
+
+    prepared = dedupe_events(events)
+    for i in range(0, len(prepared), BATCH_SIZE):
+        batch = prepared[i:i + BATCH_SIZE]
+        batch_counts = db.write(upsert_incidents_batch, batch)
+        for status, n in batch_counts.items():
+            counts[status] += n
+        logging.info(f"Upserted {i + len(batch)}/{len(prepared)} events: {batch_counts}")
+
+    logging.info(
+        f"✅ Done. {counts['inserted']} inserted, {counts['updated']} updated, "
+        f"{counts['unchanged']} unchanged, {counts['absorbed']} already clustered."
+    )
+    return counts
+
+def partition_by_jurisdiction(events, workers):
+    """Group events by jurisdiction and spread whole partitions over `workers`
+    shards, largest first onto the least-loaded shard. A jurisdiction never
+    spans two shards, so no two workers write to the same Incidents container."""
+    partitions = {}
     for event in events:
-        jurisdiction = event.get("jurisdiction") or "Unknown"
-        jurisdiction = jurisdiction.strip()
-        event["jurisdiction"] = jurisdiction
-
-        if jurisdiction == "Unknown":
-            container = ensure_container("Unknown")
-            link_container(city, container)
-        else:
-            jur_node = ensure_jurisdiction(jurisdiction, city)
-            container = ensure_container(jurisdiction)
-            link_container(jur_node, container)
-
-        insert_incident(event, container)
-        logging.info(f"Inserted: {event['id']} into {jurisdiction}")
+        partitions.setdefault(event["jurisdiction"], []).append(event)
+    shards = [[] for _ in range(workers)]
+    for _, group in sorted(partitions.items(), key=lambda kv: len(kv[1]), reverse=True):
+        min(shards, key=len).extend(group)
+    return [shard for shard in shards if shard]
+
+def _ingest_shard(shard, batch_size):
+    # One session per worker; connections come from the shared pool.
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "absorbed": 0}
+    with db.session() as session:
+        for i in range(0, len(shard), batch_size):
+            batch_counts = session.execute_write(
+                upsert_incidents_batch, shard[i:i + batch_size], ensure_containers=False
+            )
+            for status, n in batch_counts.items():
+                counts[status] += n
+    return counts
+
+def ingestevents_parallel(events: list[dict], workers: int = 4, batch_size: int = 500) -> dict:
+    ensure_schema()
+    events = dedupe_events(events)
+
+    # Shared nodes (City, jurisdictions, containers) are created up front in one
+    # transaction so the workers only ever touch their own containers.
+    db.write(ensure_containers_batch, [e["jurisdiction"] for e in events])
+
+    shards = partition_by_jurisdiction(events, workers)
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "absorbed": 0}
+    with ThreadPoolExecutor(max_workers=len(shards) or 1) as pool:
+        for shard_counts in pool.map(lambda shard: _ingest_shard(shard, batch_size), shards):
+            for status, n in shard_counts.items():
+                counts[status] += n
+
+    logging.info(
+        f"✅ Done ({len(shards)} workers). {counts['inserted']} inserted, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged, "
+        f"{counts['absorbed']} already clustered."
+    )
+    return counts
 
-    logging.info("✅ Done. All events inserted.")
 if __name__ == "__main__":
     ingest()
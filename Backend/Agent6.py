@@ -1,16 +1,13 @@
 import os
+import asyncio
 import logging
 from datetime import datetime
 from geopy.distance import geodesic
-from neo4j import GraphDatabase
 import json
 from google.cloud import pubsub_v1
-
-# === Neo4j Setup ===
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = "neo4j"
-NEO4J_PASSWORD = os.getenvb("NEO4J_PASSWORD")
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+import neo4j_client as db
+from graph_schema import ensure_schema
+from graph_queries import JURISDICTIONS_QUERY, JURISDICTION_INCIDENTS_QUERY, CITY_INCIDENTS_QUERY
 
 logging.basicConfig(level=logging.INFO)
 GCP_PROJECT = os.getenv("GCP_PROJECT")
@@ -34,15 +31,9 @@ def point_in_poly(x, y, poly):
     return inside
 
 
-# === 1. Load Traffic Jurisdictions ===
-def load_jurisdictions(tx):
-    q = """
-    MATCH (j:TrafficJurisdiction)
-    WHERE j.boundary IS NOT NULL
-    RETURN elementId(j) AS id, j.name AS name, j.boundary AS boundary
-    """
+def parse_jurisdictions(records):
     jurisdictions = []
-    for rec in tx.run(q):
+    for rec in records:
         raw = rec["boundary"]
         pts = []
         for chunk in raw.split(","):
@@ -58,12 +49,12 @@ def load_jurisdictions(tx):
             })
     return jurisdictions
 
+def load_jurisdictions(tx):
+    return parse_jurisdictions(tx.run(JURISDICTIONS_QUERY))
 
-# === 2. Find Jurisdiction for Location ===
-def find_jurisdiction(lat, lng) -> dict:
-    with driver.session() as sess:
-        jurisdictions = sess.execute_read(load_jurisdictions)
 
+# === 2. Find Jurisdiction for Location ===
+def match_jurisdiction(lat, lng, jurisdictions) -> dict:
     for jur in jurisdictions:
         if point_in_poly(lng, lat, jur["coords"]):
             logging.info(f"📍 Point inside jurisdiction '{jur['name']}' (ID: {jur['id']})")
@@ -80,44 +71,26 @@ def find_jurisdiction(lat, lng) -> dict:
         if d < min_d:
             min_d = d
             best = jur
-    logging.info(f"📍 Fallback: nearest jurisdiction '{best['name']}' (~{min_d:.1f} km)")
+    if best:
+        logging.info(f"📍 Fallback: nearest jurisdiction '{best['name']}' (~{min_d:.1f} km)")
     return best
 
+def find_jurisdiction(lat, lng) -> dict:
+    return match_jurisdiction(lat, lng, db.read(load_jurisdictions))
+
 
-# === 3. Get Jurisdiction-Specific Incidents ===
 def get_incidents_by_jurisdiction_name(jur_name):
-    q = """
-    MATCH (i:Incident)
-    WHERE i.jurisdiction = $jur_name
-    RETURN i
-    """
-    with driver.session() as sess:
-        return [dict(rec["i"]) for rec in sess.run(q, jur_name=jur_name) if rec["i"]]
+    return [rec["i"] for rec in db.query(JURISDICTION_INCIDENTS_QUERY, jur_name=jur_name) if rec["i"]]
 
 
-# === 4. Get City-Wide Incidents ===
 def get_city_incidents():
-    q = """
-    MATCH (i:Incident)
-    WHERE i.city = 'Bengaluru'
-    RETURN i
-    """
-    with driver.session() as sess:
-        return [dict(rec["i"]) for rec in sess.run(q) if rec["i"]]
+    return [rec["i"] for rec in db.query(CITY_INCIDENTS_QUERY) if rec["i"]]
 
 
 # === 5. Combined Lookup Driver ===
-def lookup_incidents(lat, lng)->dict:
-    jur = find_jurisdiction(lat, lng)
-    if not jur:
-        return {"error": "No matching jurisdiction"}
-
-    jur_incidents = get_incidents_by_jurisdiction_name(jur["name"])
+def build_lookup(jur, jur_incidents, city_incidents) -> dict:
     if not jur_incidents:
         logging.warning(f"⚠️ No incidents in '{jur['name']}'")
-
-    city_incidents = get_city_incidents()
-
     return {
         "jurisdiction_id": jur["id"],
         "jurisdiction_name": jur["name"],
@@ -125,6 +98,38 @@ def lookup_incidents(lat, lng)->dict:
         "city_incidents": city_incidents
     }
 
+def startup():
+    """Bring the graph schema up to date once per process. Call at service
+    startup (e.g. a FastAPI startup hook) before serving either lookup path."""
+    ensure_schema()
+
+async def startup_async():
+    await asyncio.to_thread(startup)
+
+def lookup_incidents(lat, lng)->dict:
+    jur = find_jurisdiction(lat, lng)
+    if not jur:
+        return {"error": "No matching jurisdiction"}
+
+    jur_incidents = get_incidents_by_jurisdiction_name(jur["name"])
+    city_incidents = get_city_incidents()
+    return build_lookup(jur, jur_incidents, city_incidents)
+
+async def lookup_incidents_async(lat, lng) -> dict:
+    """Same as lookup_incidents() on the async driver, for use inside FastAPI handlers."""
+    records = await db.query_async(JURISDICTIONS_QUERY)
+    jur = match_jurisdiction(lat, lng, parse_jurisdictions(records))
+    if not jur:
+        return {"error": "No matching jurisdiction"}
+
+    jur_records, city_records = await asyncio.gather(
+        db.query_async(JURISDICTION_INCIDENTS_QUERY, jur_name=jur["name"]),
+        db.query_async(CITY_INCIDENTS_QUERY),
+    )
+    jur_incidents = [rec["i"] for rec in jur_records if rec["i"]]
+    city_incidents = [rec["i"] for rec in city_records if rec["i"]]
+    return build_lookup(jur, jur_incidents, city_incidents)
+
 def publish_single_event(event, source_label="jurisdiction",publisher=None, topic_path=None):
     message = {
         "source": source_label,
@@ -151,6 +156,7 @@ if __name__ == "__main__":
     test_lat = 12.9127
     test_lng = 77.6228
 
+    startup()
     result = lookup_incidents(test_lat, test_lng)
     publisher = pubsub_v1.PublisherClient()
     topic_path = publisher.topic_path(GCP_PROJECT, PUBSUB_TOPIC)
@@ -0,0 +1,337 @@
+"""Throughput and quality benchmark for the dedup engines on synthetic incidents.
+
+    python dedup_benchmark.py                          # 1k, 10k, 100k with the real encoder
+    python dedup_benchmark.py --sizes 1000 --encoder hashing
+    python dedup_benchmark.py --out bench.json         # save results
+    python dedup_benchmark.py --baseline bench.json    # exit 1 on speed/quality regressions
+
+Nothing touches Neo4j or Gemini: summaries are stubbed and cluster writes go to
+an in-memory stand-in for the graph.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import functools
+import resource
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import deduplication_agent as dedup
+import online_clusterer
+from dedup_writer import build_cluster, write_clusters, write_summaries
+from summary_cache import SummaryCache
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+SEED = 42
+# Reports per day; the corpus spans size / ITEMS_PER_DAY days so density is the same at every scale.
+ITEMS_PER_DAY = 150
+# A run regresses when throughput drops or quality falls by more than these margins.
+MAX_SLOWDOWN = 0.20
+MAX_QUALITY_DROP = 0.02
+
+# === Synthetic corpus ===
+LOCALITIES = [
+    # (locality, jurisdiction, lat, lng)
+    ("Silk Board junction", "Madiwala Traffic PS", 12.9177, 77.6233),
+    ("Koramangala 80 Feet Road", "Adugodi Traffic PS", 12.9352, 77.6245),
+    ("Hebbal flyover", "Hebbal Traffic PS", 13.0358, 77.5970),
+    ("Outer Ring Road, Marathahalli", "HAL Airport Traffic PS", 12.9569, 77.7011),
+    ("MG Road", "Cubbon Park Traffic PS", 12.9756, 77.6066),
+    ("KR Puram bridge", "KR Puram Traffic PS", 13.0070, 77.6960),
+    ("Majestic bus stand", "Upparpet Traffic PS", 12.9767, 77.5713),
+    ("Electronic City toll", "Electronic City Traffic PS", 12.8452, 77.6602),
+    ("Yeshwanthpur circle", "Yeshwanthpur Traffic PS", 13.0285, 77.5409),
+    ("Jayanagar 4th Block", "Jayanagar Traffic PS", 12.9250, 77.5838),
+    ("Whitefield main road", "Whitefield Traffic PS", 12.9698, 77.7500),
+    ("Bannerghatta Road, Dairy Circle", "Mico Layout Traffic PS", 12.9367, 77.6010),
+]
+
+TEMPLATES = {
+    "traffic": [
+        "Heavy traffic jam at {place}",
+        "Massive traffic congestion reported near {place}",
+        "Vehicles crawling at {place} due to heavy traffic",
+        "Commuters stuck in long traffic queue at {place}",
+        "Traffic moving very slowly around {place} this {time_of_day}",
+    ],
+    "waterlogging": [
+        "Severe waterlogging at {place} after heavy rain",
+        "Road flooded near {place}, vehicles stranded",
+        "Knee-deep water on the road at {place}",
+        "Rainwater accumulation causes flooding at {place}",
+    ],
+    "tree_fall": [
+        "Tree falls on road at {place}, lane blocked",
+        "Uprooted tree blocks traffic near {place}",
+        "Huge tree collapses at {place} after strong winds",
+    ],
+    "accident": [
+        "Accident involving two vehicles at {place}",
+        "Car and bike collide near {place}, traffic affected",
+        "Road accident reported at {place} this {time_of_day}",
+        "Bus accident near {place} causes traffic snarl",
+    ],
+    "power_outage": [
+        "Power cut in areas around {place} since {time_of_day}",
+        "BESCOM outage reported near {place}",
+        "No electricity near {place} for several hours",
+    ],
+    "protest": [
+        "Protest march near {place} causes diversions",
+        "Demonstration at {place} blocks the road",
+        "Rally near {place}, police divert traffic",
+    ],
+}
+TIMES_OF_DAY = ["morning", "afternoon", "evening", "night"]
+SOURCES = ["twitter", "reddit", "news", "citizen_report"]
+
+
+def generate_corpus(n_items, seed=SEED, per_day=ITEMS_PER_DAY):
+    """n_items incident items whose `truth` field names the real-world event they report.
+    Event sizes are skewed (many singletons, a few large events) like real feeds."""
+    rng = random.Random(seed)
+    days = max(1.0, n_items / per_day)
+    # Dated relative to now so the online engine sees them as recent.
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    items = []
+    event_no = 0
+    while len(items) < n_items:
+        event_no += 1
+        event_type = rng.choice(list(TEMPLATES))
+        place, jurisdiction, lat, lng = rng.choice(LOCALITIES)
+        when = start + timedelta(seconds=rng.uniform(0, days * 86400))
+        time_of_day = TIMES_OF_DAY[when.hour // 6]
+        size = min(n_items - len(items), max(1, int(rng.paretovariate(1.3))))
+        for _ in range(size):
+            title = rng.choice(TEMPLATES[event_type]).format(place=place, time_of_day=time_of_day)
+            items.append({
+                "id": f"bench-{len(items)}",
+                "title": title,
+                "source": rng.choice(SOURCES),
+                "event_type": event_type,
+                "jurisdiction": jurisdiction,
+                "label": "Incident",
+                "published": (when + timedelta(minutes=rng.uniform(0, 240))).isoformat(),
+                "lat": lat + rng.gauss(0, 0.003),
+                "lng": lng + rng.gauss(0, 0.003),
+                "embedding": None,
+                "truth": f"event-{event_no}",
+            })
+    return items
+
+
+# === Encoders ===
+def hashing_embed(titles, dim=dedup.EMBEDDING_DIM):
+    """Model-free stand-in: signed hashed word and character-trigram counts, unit-normalized."""
+    out = np.zeros((len(titles), dim), dtype=np.float32)
+    for row, title in enumerate(titles):
+        text = dedup.normalize_title(title)
+        grams = text.split() + [text[i:i + 3] for i in range(len(text) - 2)]
+        for gram in grams:
+            h = int.from_bytes(hashlib.md5(gram.encode("utf-8")).digest()[:4], "little")
+            out[row, h % dim] += 1.0 if h & (1 << 31) else -1.0
+    out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+    return out
+
+
+def embed(items, encoder):
+    titles = [e["title"] for e in items]
+    vectors = hashing_embed(titles) if encoder == "hashing" else dedup.encode_titles(titles)
+    for item, vector in zip(items, vectors):
+        item["embedding"] = vector
+
+
+# === In-memory graph ===
+class InMemoryGraph:
+    """Stands in for neo4j_client in the engines: cluster writes and
+    attachments are applied to a dict instead of the database."""
+
+    def __init__(self):
+        self.clusters = {}
+
+    def query(self, cypher, **params):
+        return []
+
+    def write(self, fn, *args, **kwargs):
+        if fn is write_clusters:
+            for row in args[0]:
+                self.clusters[row["props"]["id"]] = [member_id for member_id, _ in row["members"]]
+            return len(args[0])
+        if fn is dedup.attach_to_cluster:
+            cluster, members = args
+            self.clusters[cluster["id"]].extend(e["id"] for e in members)
+            return None
+        if fn in (dedup.store_embeddings, write_summaries):
+            return None
+        raise NotImplementedError(f"InMemoryGraph cannot run {fn.__name__}")
+
+    def labels(self):
+        """item id -> cluster id for every clustered item."""
+        return {member: cluster_id for cluster_id, members in self.clusters.items() for member in members}
+
+
+def stub_summarize(titles, event_type, jurisdiction):
+    return f"{len(titles)} reports of {event_type} in {jurisdiction}"
+
+
+# === Engines ===
+def run_batch(items, graph):
+    grouped = dedup.group_by_bucket(items)
+    results = dedup.deduplicate_buckets(grouped)
+    jobs = [
+        (cluster, jurisdiction, event_type)
+        for (jurisdiction, event_type), clusters in results.items()
+        for cluster in clusters
+    ]
+    summaries = dedup.summarize_clusters(jobs)
+    rows = [
+        build_cluster(cluster, jurisdiction, event_type, summary, dedup.EMBEDDING_VERSION)
+        for (cluster, jurisdiction, event_type), summary in zip(jobs, summaries)
+    ]
+    graph.write(write_clusters, rows)
+
+
+def run_online(items, graph, batch_size=200):
+    clusterer = online_clusterer.OnlineClusterer()
+    # Replay in publication order, one ingest micro-batch at a time.
+    ordered = sorted(items, key=lambda e: e["published"])
+    for start in range(0, len(ordered), batch_size):
+        clusterer.assign_many(ordered[start:start + batch_size])
+
+
+ENGINES = {"batch": run_batch, "online": run_online}
+
+
+# === Metrics ===
+def pairs(n):
+    return n * (n - 1) // 2
+
+
+def pairwise_scores(items, labels):
+    """Pairwise precision/recall of predicted clusters against ground truth;
+    unclustered items count as singletons."""
+    truth_sizes, pred_sizes, joint = {}, {}, {}
+    for item in items:
+        pred = labels.get(item["id"], item["id"])
+        truth_sizes[item["truth"]] = truth_sizes.get(item["truth"], 0) + 1
+        pred_sizes[pred] = pred_sizes.get(pred, 0) + 1
+        joint[(pred, item["truth"])] = joint.get((pred, item["truth"]), 0) + 1
+    true_positive = sum(pairs(n) for n in joint.values())
+    predicted = sum(pairs(n) for n in pred_sizes.values())
+    actual = sum(pairs(n) for n in truth_sizes.values())
+    precision = true_positive / predicted if predicted else 1.0
+    recall = true_positive / actual if actual else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
+
+
+def benchmark(size, engine, encoder, verbose=False):
+    items = generate_corpus(size)
+    graph = InMemoryGraph()
+    dedup._summary_cache = SummaryCache(os.path.join(tempfile.mkdtemp(), "summaries.json"))
+    real_db = online_clusterer.db
+    online_clusterer.db = graph
+    sink = sys.stdout if verbose else io.StringIO()
+    try:
+        with redirect_stdout(sink):
+            started = time.perf_counter()
+            embed(items, encoder)
+            encoded = time.perf_counter()
+            tracemalloc.start()
+            ENGINES[engine](items, graph)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            finished = time.perf_counter()
+    finally:
+        online_clusterer.db = real_db
+
+    cluster_s = finished - encoded
+    return {
+        "size": size,
+        "engine": engine,
+        "encoder": encoder,
+        "clusters": len(graph.clusters),
+        "encode_s": round(encoded - started, 3),
+        "cluster_s": round(cluster_s, 3),
+        "items_per_s": round(size / cluster_s, 1) if cluster_s else None,
+        "peak_mb": round(peak / 2**20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        **pairwise_scores(items, graph.labels()),
+    }
+
+
+def find_regressions(results, baseline):
+    previous = {(r["size"], r["engine"], r["encoder"]): r for r in baseline}
+    problems = []
+    for r in results:
+        old = previous.get((r["size"], r["engine"], r["encoder"]))
+        if not old:
+            continue
+        name = f"{r['engine']}/{r['encoder']}@{r['size']}"
+        if old.get("items_per_s") and r["items_per_s"] < old["items_per_s"] * (1 - MAX_SLOWDOWN):
+            problems.append(f"{name}: {r['items_per_s']} items/s (was {old['items_per_s']})")
+        for metric in ("precision", "recall"):
+            if r[metric] < old[metric] - MAX_QUALITY_DROP:
+                problems.append(f"{name}: {metric} {r[metric]} (was {old[metric]})")
+    return problems
+
+
+def print_table(results):
+    header = f"{'engine':<8}{'encoder':<9}{'size':>8}{'clusters':>10}{'items/s':>11}{'peak MB':>9}" \
+             f"{'RSS MB':>9}{'prec':>8}{'recall':>8}{'f1':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['engine']:<8}{r['encoder']:<9}{r['size']:>8}{r['clusters']:>10}{r['items_per_s']:>11}"
+              f"{r['peak_mb']:>9}{r['max_rss_mb']:>9}{r['precision']:>8}{r['recall']:>8}{r['f1']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dedup clustering on synthetic incidents")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--encoder", choices=["model", "hashing"], default="model")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous --out run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the engines' own output")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    # No Gemini: stub summaries, and no rate limit (the online engine uses the defaults).
+    dedup.summarize_titles = stub_summarize
+    dedup.summarize_clusters = functools.partial(dedup.summarize_clusters, per_minute=0)
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        for engine in args.engines.split(","):
+            print(f"[🏁] {engine} engine, {size} items ({args.encoder} encoder)")
+            results.append(benchmark(size, engine, args.encoder, args.verbose))
+    print()
+    print_table(results)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = find_regressions(results, json.load(f))
+        if problems:
+            print("\n❌ Regressions against baseline:")
+            for problem in problems:
+                print(f"  - {problem}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
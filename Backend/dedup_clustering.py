@@ -0,0 +1,259 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+try:
+    import faiss  # optional, only used for very large buckets
+except ImportError:
+    faiss = None
+
+BLOCK_SIZE = 2048
+ANN_MIN_ITEMS = 20000
+ANN_NEIGHBOURS = 32
+
+# Time/distance-aware scoring: score = cosine
+#   - TIME_WEIGHT * (dt / window)                    (pairs further apart than window never link)
+#   - GEO_WEIGHT * min(distance_km / GEO_SCALE_KM, 1) (only when both items have coordinates)
+TIME_WINDOW_S = 48 * 3600
+TIME_WEIGHT = 0.1
+GEO_WEIGHT = 0.15
+GEO_SCALE_KM = 5.0
+EARTH_RADIUS_KM = 6371.0
+
+
+def centroid(embeddings, weights=None):
+    """(Weighted) mean of unit vectors, re-normalized."""
+    vector = np.average(np.asarray(embeddings, dtype=np.float32), axis=0, weights=weights)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def blocked_edges(embeddings, threshold, block_size=BLOCK_SIZE):
+    """All pairs (i, j), i < j, with cosine similarity above `threshold`.
+
+    `embeddings` must be unit-normalized. Similarities are computed one
+    block_size x block_size tile of the upper triangle at a time, so memory
+    stays bounded however large the bucket is.
+    """
+    n = len(embeddings)
+    rows, cols = [], []
+    for r0 in range(0, n, block_size):
+        r1 = min(r0 + block_size, n)
+        for c0 in range(r0, n, block_size):
+            c1 = min(c0 + block_size, n)
+            sims = embeddings[r0:r1] @ embeddings[c0:c1].T
+            if c0 == r0:
+                # Diagonal tile: keep only the strict upper triangle.
+                sims[np.tril_indices(r1 - r0, k=0, m=c1 - c0)] = -1.0
+            r, c = np.nonzero(sims > threshold)
+            rows.append(r + r0)
+            cols.append(c + c0)
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def haversine_matrix(a, b):
+    """Pairwise great-circle distances (km) between (lat, lng) rows of a and b; NaN rows give NaN."""
+    lat1, lng1 = np.radians(a[:, 0])[:, None], np.radians(a[:, 1])[:, None]
+    lat2, lng2 = np.radians(b[:, 0])[None, :], np.radians(b[:, 1])[None, :]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def windowed_edges(embeddings, times, threshold, coords=None, window=TIME_WINDOW_S,
+                   block_size=BLOCK_SIZE, time_weight=TIME_WEIGHT, geo_weight=GEO_WEIGHT,
+                   geo_scale_km=GEO_SCALE_KM):
+    """Like blocked_edges(), but items are sorted by time and each block is only
+    compared with the items that fall inside the sliding `window` after it, so
+    the work grows with items-per-window rather than with the whole history.
+    `times` are epoch seconds; `coords` is an (n, 2) lat/lng array with NaN
+    where unknown."""
+    order = np.argsort(times, kind="stable")
+    emb, ts = embeddings[order], times[order]
+    pts = coords[order] if coords is not None else None
+    n = len(order)
+    rows, cols = [], []
+    for r0 in range(0, n, block_size):
+        r1 = min(r0 + block_size, n)
+        end = int(np.searchsorted(ts, ts[r1 - 1] + window, side="right"))
+        for c0 in range(r0, end, block_size):
+            c1 = min(c0 + block_size, end)
+            dt = np.abs(ts[c0:c1][None, :] - ts[r0:r1][:, None])
+            score = emb[r0:r1] @ emb[c0:c1].T - time_weight * (dt / window)
+            score[dt > window] = -np.inf
+            if pts is not None:
+                dist = haversine_matrix(pts[r0:r1], pts[c0:c1])
+                score -= np.nan_to_num(geo_weight * np.minimum(dist / geo_scale_km, 1.0), nan=0.0)
+            if c0 == r0:
+                score[np.tril_indices(r1 - r0, k=0, m=c1 - c0)] = -np.inf
+            r, c = np.nonzero(score > threshold)
+            rows.append(order[r + r0])
+            cols.append(order[c + c0])
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def haversine_rows(a, b):
+    """Great-circle distance (km) between matching (lat, lng) rows of a and b."""
+    lat1, lng1, lat2, lng2 = (np.radians(x) for x in (a[:, 0], a[:, 1], b[:, 0], b[:, 1]))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def pair_scores(embeddings, times, coords, rows, cols, window=TIME_WINDOW_S):
+    """Scores of the pairs (rows[k], cols[k]) with the same penalties as
+    windowed_edges(); a pair with an unknown time gets no time penalty."""
+    scores = np.einsum("ij,ij->i", embeddings[rows], embeddings[cols])
+    dt = np.abs(times[rows] - times[cols])
+    known = ~np.isnan(dt)
+    scores[known] -= TIME_WEIGHT * dt[known] / window
+    scores[known & (dt > window)] = -np.inf
+    if coords is not None:
+        dist = haversine_rows(coords[rows], coords[cols])
+        scores -= np.nan_to_num(GEO_WEIGHT * np.minimum(dist / GEO_SCALE_KM, 1.0), nan=0.0)
+    return scores
+
+
+def undated_edges(embeddings, times, threshold, coords=None, block_size=BLOCK_SIZE):
+    """Edges between undated items (NaN time) and every other item, scored on
+    text and distance only, the way centroid_scores() treats unknown times."""
+    n = len(embeddings)
+    undated = np.nonzero(np.isnan(times))[0]
+    rows, cols = [], []
+    for r0 in range(0, len(undated), block_size):
+        block = undated[r0:r0 + block_size]
+        for c0 in range(0, n, block_size):
+            c1 = min(c0 + block_size, n)
+            r, c = np.nonzero(embeddings[block] @ embeddings[c0:c1].T > threshold)
+            r, c = block[r], c + c0
+            # Each undated/undated pair once, no self pairs.
+            keep = ~np.isnan(times[c]) | (c > r)
+            rows.append(r[keep])
+            cols.append(c[keep])
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    keep = pair_scores(embeddings, times, coords, rows, cols) > threshold
+    return rows[keep], cols[keep]
+
+
+def peak_window_items(times, window=TIME_WINDOW_S):
+    """Largest number of (dated) items falling inside any one window."""
+    ts = np.sort(times)
+    if not len(ts):
+        return 0
+    return int(np.max(np.searchsorted(ts, ts + window, side="right") - np.arange(len(ts))))
+
+
+def centroid_scores(embedding, time, point, centroids, times, points, window=TIME_WINDOW_S):
+    """Score one item against many cluster centroids with the same penalties as
+    windowed_edges(). `time` may be NaN and `point` (lat, lng) may hold NaNs."""
+    scores = centroids @ embedding
+    dt = np.abs(times - time)
+    known = ~np.isnan(dt)
+    scores[known] -= TIME_WEIGHT * dt[known] / window
+    scores[known & (dt > window)] = -np.inf
+    dist = haversine_matrix(np.asarray(point, dtype=np.float64).reshape(1, 2), points)[0]
+    scores -= np.nan_to_num(GEO_WEIGHT * np.minimum(dist / GEO_SCALE_KM, 1.0), nan=0.0)
+    return scores
+
+
+def ann_edges(embeddings, threshold, neighbours=ANN_NEIGHBOURS):
+    """Approximate edge list from an HNSW inner-product index (requires faiss)."""
+    n, dim = embeddings.shape
+    index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+    index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+    sims, idx = index.search(np.ascontiguousarray(embeddings, dtype=np.float32), min(neighbours, n))
+    rows = np.repeat(np.arange(n), idx.shape[1])
+    cols = idx.ravel()
+    keep = (sims.ravel() > threshold) & (cols > rows)
+    return rows[keep], cols[keep]
+
+
+def ann_windowed_edges(embeddings, times, threshold, coords=None, window=TIME_WINDOW_S,
+                       neighbours=ANN_NEIGHBOURS):
+    """Approximate windowed_edges() for dense windows (requires faiss).
+
+    Items are cut into slabs `window` seconds wide. Any pair inside the window
+    lies in one slab or two adjacent ones, so an HNSW index is built over each
+    pair of adjacent slabs. Its text neighbours are then re-scored with the
+    time and distance penalties."""
+    slabs = np.floor((times - times.min()) / window).astype(np.int64)
+    rows, cols = [], []
+    for slab in np.unique(slabs):
+        members = np.nonzero((slabs == slab) | (slabs == slab + 1))[0]
+        if len(members) < 2:
+            continue
+        r, c = ann_edges(embeddings[members], threshold, neighbours)
+        rows.append(members[r])
+        cols.append(members[c])
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    keep = pair_scores(embeddings, times, coords, rows, cols, window) > threshold
+    return rows[keep], cols[keep]
+
+
+def cluster_embeddings(embeddings, threshold, min_size=3, block_size=BLOCK_SIZE, use_ann=None,
+                       times=None, coords=None, window=TIME_WINDOW_S):
+    """Group rows of `embeddings` into clusters of similar items.
+
+    Pairs above `threshold` become edges and clusters are the connected
+    components of that graph. Because components chain (a~b, b~c pulls in c
+    even if a and c differ), members less similar than `threshold` to their
+    cluster centroid are dropped again, which keeps results close to the old
+    greedy seed-and-sweep clusters. Returns a list of index arrays, largest
+    first, each with at least `min_size` members.
+
+    With `times` (epoch seconds, NaN if unknown) items are split by date:
+    dated pairs are scored by windowed_edges() (or ann_windowed_edges() when
+    some window holds ANN_MIN_ITEMS or more and faiss is available), and
+    every pair involving an undated item, e.g. a legacy cluster, is scored
+    on text and distance without a time penalty, the same as
+    centroid_scores() does. So undated items can link with dated ones.
+    Without `times`, all pairs are scored on text, by ANN for buckets of
+    ANN_MIN_ITEMS or more.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = len(embeddings)
+    if n < min_size:
+        return []
+
+    if times is not None:
+        times = np.asarray(times, dtype=np.float64)
+        coords = np.asarray(coords, dtype=np.float64) if coords is not None else None
+        dated = np.nonzero(~np.isnan(times))[0]
+        sub_coords = coords[dated] if coords is not None else None
+        if use_ann is None:
+            use_ann = faiss is not None and peak_window_items(times[dated], window) >= ANN_MIN_ITEMS
+        if use_ann and len(dated):
+            r1, c1 = ann_windowed_edges(embeddings[dated], times[dated], threshold, sub_coords, window)
+        else:
+            r1, c1 = windowed_edges(embeddings[dated], times[dated], threshold, sub_coords, window, block_size)
+        r2, c2 = undated_edges(embeddings, times, threshold, coords, block_size)
+        rows = np.concatenate([dated[r1], r2])
+        cols = np.concatenate([dated[c1], c2])
+    else:
+        if use_ann is None:
+            use_ann = faiss is not None and n >= ANN_MIN_ITEMS
+        if use_ann:
+            rows, cols = ann_edges(embeddings, threshold)
+        else:
+            rows, cols = blocked_edges(embeddings, threshold, block_size)
+
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    clusters = []
+    sizes = np.bincount(labels)
+    for label in np.nonzero(sizes >= min_size)[0]:
+        members = np.nonzero(labels == label)[0]
+        center = embeddings[members].mean(axis=0)
+        center /= np.linalg.norm(center) or 1.0
+        members = members[embeddings[members] @ center > threshold]
+        if len(members) >= min_size:
+            clusters.append(members)
+    clusters.sort(key=len, reverse=True)
+    return clusters
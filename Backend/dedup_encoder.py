@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import threading
+
+import numpy as np
+
+# === Config ===
+MODEL_NAME = "all-MiniLM-L6-v2"
+HF_MODEL_ID = f"sentence-transformers/{MODEL_NAME}"
+EMBEDDING_DIM = 384
+MAX_SEQ_LENGTH = 256
+# "torch" (SentenceTransformer) or "onnx" (int8-quantized ONNX Runtime, CPU only)
+ENCODER_BACKEND = os.getenv("DEDUP_ENCODER", "torch")
+ENCODER_THREADS = int(os.getenv("DEDUP_ENCODER_THREADS", str(os.cpu_count() or 1)))
+ONNX_DIR = os.getenv("DEDUP_ONNX_DIR", ".onnx/" + MODEL_NAME)
+ONNX_MODEL_FILE = "model-int8.onnx"
+# Exported models must stay this close (cosine) to the PyTorch embeddings.
+ONNX_MIN_COSINE = 0.99
+
+VALIDATION_TITLES = [
+    "Heavy traffic on Old Airport Road near Domlur flyover",
+    "Waterlogging at Silk Board junction after overnight rain",
+    "Tree fall blocks lane on Bellary Road, commuters advised to avoid",
+    "Power cut in HSR Layout sector 2 since morning",
+    "Protest march at Freedom Park causes diversions in Gandhinagar",
+    "Pothole-ridden stretch on Outer Ring Road slows traffic",
+    "ಮೆಜೆಸ್ಟಿಕ್ ಬಳಿ ಭಾರಿ ಸಂಚಾರ ದಟ್ಟಣೆ",
+    "Metro services delayed on Purple Line",
+]
+
+
+class TorchEncoder:
+    def __init__(self, threads=ENCODER_THREADS):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(threads)
+        self.model = SentenceTransformer(MODEL_NAME, device="cpu")
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, titles, batch_size=64):
+        return self.model.encode(list(titles), batch_size=batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+class OnnxEncoder:
+    """Mean-pooled, normalized MiniLM embeddings from an int8 ONNX export."""
+
+    def __init__(self, model_dir=ONNX_DIR, threads=ENCODER_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "validation.json"), "r", encoding="utf-8") as f:
+            report = json.load(f)
+        if report.get("min_cosine", 0) < ONNX_MIN_COSINE:
+            raise RuntimeError(f"ONNX model in {model_dir} failed validation: {report}")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(os.path.join(model_dir, ONNX_MODEL_FILE), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+        self.dimension = EMBEDDING_DIM
+
+    def encode(self, titles, batch_size=64):
+        titles = list(titles)
+        out = np.zeros((len(titles), self.dimension), dtype=np.float32)
+        for start in range(0, len(titles), batch_size):
+            batch = self.tokenizer.encode_batch(titles[start:start + batch_size])
+            feeds = {
+                "input_ids": np.array([e.ids for e in batch], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in batch], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in batch], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            mask = feeds["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out[start:start + len(batch)] = pooled
+        return out
+
+
+_encoder = None
+_lock = threading.Lock()
+
+
+def get_encoder():
+    """Load the configured encoder on first use, so importing the dedup agent stays cheap."""
+    global _encoder
+    if _encoder is None:
+        with _lock:
+            if _encoder is None:
+                if ENCODER_BACKEND == "onnx":
+                    try:
+                        _encoder = OnnxEncoder()
+                    except Exception as e:
+                        print(f"⚠️ ONNX encoder unavailable ({e}); falling back to PyTorch")
+                if _encoder is None:
+                    _encoder = TorchEncoder()
+    return _encoder
+
+
+def compare_encoders(reference, candidate, titles=VALIDATION_TITLES):
+    a = reference.encode(titles)
+    b = candidate.encode(titles)
+    cosines = (a * b).sum(axis=1)
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean()), "titles": len(titles)}
+
+
+def export_onnx(model_dir=ONNX_DIR):
+    """Export MiniLM to ONNX, quantize weights to int8, and validate against PyTorch."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
+    hf_model = AutoModel.from_pretrained(HF_MODEL_ID).eval()
+    tokenizer.save_pretrained(model_dir)
+
+    fp32_path = os.path.join(model_dir, "model-fp32.onnx")
+    dummy = tokenizer(["Bengaluru traffic update"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(hf_model, tuple(dummy[n] for n in names), fp32_path,
+                          input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=14)
+    quantize_dynamic(fp32_path, os.path.join(model_dir, ONNX_MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    # Write a provisional report so OnnxEncoder will load, then replace it with the real one.
+    report_path = os.path.join(model_dir, "validation.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"min_cosine": 1.0}, f)
+    report = compare_encoders(TorchEncoder(), OnnxEncoder(model_dir))
+    report["passed"] = report["min_cosine"] >= ONNX_MIN_COSINE
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"{'✅' if report['passed'] else '❌'} ONNX int8 export: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    if "--export" in sys.argv:
+        export_onnx()
+    else:
+        print(compare_encoders(TorchEncoder(), OnnxEncoder()))
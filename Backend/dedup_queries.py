@@ -0,0 +1,103 @@
+# Cypher run by the dedup pipeline. Kept out of deduplication_agent and
+# dedup_writer so that graph_schema can EXPLAIN the real hot-path queries
+# without importing the pipeline (which itself imports graph_schema).
+
+ITEM_LABELS = ("Incident", "EventCluster")
+
+ITEM_FIELDS = """
+        RETURN n.id AS id,
+               COALESCE(n.title_sample, n.title) AS title,
+               n.source AS source,
+               n.event_type AS event_type,
+               n.jurisdiction AS jurisdiction,
+               labels(n)[0] AS label,
+               n.published AS published,
+               n.lat AS lat,
+               n.lng AS lng,
+               n.event_ids AS event_ids,
+               n.event_count AS event_count,
+               CASE WHEN n.embedding_model = $model
+                         AND n.embedding_title = COALESCE(n.title_sample, n.title)
+                    THEN n.embedding END AS embedding
+"""
+
+
+def per_label(match):
+    """`match` (a MATCH ... WHERE with a {label} placeholder) once per item label,
+    combined with UNION ALL, so each branch is planned from its label's indexes
+    instead of an all-nodes scan."""
+    return "\nUNION ALL\n".join(match.format(label=label) + ITEM_FIELDS for label in ITEM_LABELS)
+
+
+ALL_ITEMS_QUERY = per_label("""
+        MATCH (n:{label})
+        WHERE n.title_sample IS NOT NULL OR n.title IS NOT NULL
+""")
+
+# Missing embedding, from another model, or for an old title.
+UNEMBEDDED_ITEMS_QUERY = per_label("""
+        MATCH (n:{label})
+        WHERE (n.title_sample IS NOT NULL OR n.title IS NOT NULL)
+          AND (n.embedding IS NULL
+               OR n.embedding_model IS NULL OR n.embedding_model <> $model
+               OR n.embedding_title IS NULL OR n.embedding_title <> COALESCE(n.title_sample, n.title))
+""")
+
+# $buckets: [[jurisdiction, event_type], ...], both set; seeks the (jurisdiction, event_type) index.
+BUCKET_ITEMS_QUERY = per_label("""
+        UNWIND $buckets AS b
+        MATCH (n:{label})
+        WHERE n.jurisdiction = b[0] AND n.event_type = b[1]
+          AND n.embedding_model = $model
+          AND ($since IS NULL OR n.published IS NULL OR n.published >= $since)
+""")
+
+# Buckets with a missing jurisdiction or event_type ('' stands for null); such
+# nodes are not in the composite index, so these go through embedding_model.
+PARTIAL_BUCKET_ITEMS_QUERY = per_label("""
+        UNWIND $buckets AS b
+        MATCH (n:{label})
+        WHERE n.embedding_model = $model
+          AND COALESCE(n.jurisdiction, '') = b[0] AND COALESCE(n.event_type, '') = b[1]
+          AND ($since IS NULL OR n.published IS NULL OR n.published >= $since)
+""")
+
+# === Written by dedup_writer ===
+# Pass 1: the cluster nodes themselves.
+CREATE_CLUSTERS_QUERY = """
+UNWIND $clusters AS row
+CREATE (c:EventCluster)
+SET c = row.props, c.created_at = datetime(row.created_at)
+WITH c, row
+OPTIONAL MATCH (j:Jurisdiction {name: row.props.jurisdiction})
+FOREACH (_ IN CASE WHEN j IS NOT NULL THEN [1] ELSE [] END |
+    MERGE (c)-[:BELONGS_TO]->(j)
+)
+"""
+
+# Pass 2: incident members are absorbed (their ids live on in event_ids, and
+# a tombstone keeps the ingest upsert from creating them again).
+INCIDENT_MEMBERS_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Incident {id: row.member_id})
+MERGE (a:AbsorbedIncident {id: n.id})
+SET a.absorbed_at = datetime()
+DETACH DELETE n
+"""
+
+# Pass 3: cluster members hand their incidents to the new cluster and go away.
+CLUSTER_MEMBERS_QUERY = """
+UNWIND $rows AS row
+MATCH (c:EventCluster {id: row.cluster_id})
+MATCH (old:EventCluster {id: row.member_id})
+OPTIONAL MATCH (i:Incident)-[:PART_OF]->(old)
+WITH c, old, collect(i) AS incidents
+FOREACH (x IN incidents | MERGE (x)-[:PART_OF]->(c))
+DETACH DELETE old
+"""
+
+SUMMARIES_QUERY = """
+UNWIND $rows AS row
+MATCH (c:EventCluster {id: row.id})
+SET c.summary = row.summary
+"""
@@ -0,0 +1,136 @@
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import neo4j_client as db
+from dedup_clustering import centroid
+from dedup_queries import (CREATE_CLUSTERS_QUERY, INCIDENT_MEMBERS_QUERY, CLUSTER_MEMBERS_QUERY,
+                           SUMMARIES_QUERY)
+
+WRITE_BATCH_SIZE = 200
+
+
+def member_event_ids(cluster):
+    """Underlying event ids of a cluster, each once; merged EventCluster members contribute their event_ids."""
+    ids = {}
+    for e in cluster:
+        ids.update(dict.fromkeys(e.get("event_ids") or [e["id"]]))
+    return list(ids)
+
+
+def member_weight(e):
+    """Number of events a member stands for: 1 for an incident, its event count for a merged cluster."""
+    return e.get("event_count") or len(e.get("event_ids") or []) or 1
+
+
+def build_cluster(cluster, jurisdiction, event_type, summary, embedding_version):
+    """Turn a list of member items into the row the bulk writer expects.
+    Merged EventCluster members weigh in the centroid and location by their size."""
+    titles = [e["title"] for e in cluster if e.get("title")]
+    embedded = [e for e in cluster if e.get("embedding") is not None]
+    event_ids = member_event_ids([e for e in cluster if e.get("id")])
+    title_sample = titles[0] if titles else "Untitled Cluster"
+    published = [e["published"] for e in cluster if isinstance(e.get("published"), str)]
+    located = [e for e in cluster if e.get("lat") is not None and e.get("lng") is not None]
+    located_weight = sum(member_weight(e) for e in located)
+    return {
+        "props": {
+            "id": str(uuid.uuid4()),
+            "event_type": event_type,
+            "jurisdiction": jurisdiction,
+            "event_ids": event_ids,
+            "sources": list({e["source"] for e in cluster if e.get("source")}),
+            "event_count": len(event_ids),
+            "title_sample": title_sample,
+            "summary": summary,
+            "merged_titles": titles,
+            "embedding": [float(x) for x in centroid([e["embedding"] for e in embedded],
+                                                     weights=[member_weight(e) for e in embedded])]
+                         if embedded else None,
+            "embedding_model": embedding_version,
+            "embedding_title": title_sample,
+            # Latest member time and mean event location, so the cluster can
+            # take part in time/distance-aware matching like an incident.
+            "published": max(published) if published else None,
+            "lat": sum(e["lat"] * member_weight(e) for e in located) / located_weight if located else None,
+            "lng": sum(e["lng"] * member_weight(e) for e in located) / located_weight if located else None,
+        },
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "members": [(e["id"], e.get("label")) for e in cluster if e.get("id")],
+    }
+
+
+def write_clusters(tx, rows):
+    """Create many clusters and absorb their members in one transaction,
+    using plain label-specific UNWIND passes (no APOC)."""
+    tx.run(CREATE_CLUSTERS_QUERY, clusters=[{"props": r["props"], "created_at": r["created_at"]} for r in rows])
+    incident_rows, cluster_rows = [], []
+    for row in rows:
+        for member_id, label in row["members"]:
+            target = cluster_rows if label == "EventCluster" else incident_rows
+            target.append({"cluster_id": row["props"]["id"], "member_id": member_id})
+    if incident_rows:
+        tx.run(INCIDENT_MEMBERS_QUERY, rows=incident_rows)
+    if cluster_rows:
+        tx.run(CLUSTER_MEMBERS_QUERY, rows=cluster_rows)
+    return len(rows)
+
+
+def write_summaries(tx, rows):
+    """Fill in summaries of clusters written without one: [{"id", "summary"}, ...]."""
+    tx.run(SUMMARIES_QUERY, rows=rows)
+
+
+def write_all_clusters(session, rows, batch_size=WRITE_BATCH_SIZE):
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        written += session.execute_write(write_clusters, rows[start:start + batch_size])
+    print(f"[📌] Wrote {written} clusters in {-(-len(rows) // batch_size)} transactions")
+    return written
+
+
+def smoke_test():
+    """Round-trip against a throwaway database, e.g.
+    docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/password neo4j:5
+    NEO4J_URI=bolt://localhost:7687 NEO4J_PASSWORD=password python dedup_writer.py --smoke
+    """
+    tag = f"smoke-{uuid.uuid4()}"
+    with db.session() as session:
+        session.run("""
+            CREATE (:Incident {id: $tag + '-i1', title: 'a'}),
+                   (:Incident {id: $tag + '-i2', title: 'b'}),
+                   (old:EventCluster {id: $tag + '-c1', title_sample: 'c'}),
+                   (:Incident {id: $tag + '-i3', title: 'd'})-[:PART_OF]->(old)
+        """, tag=tag).consume()
+        members = [
+            {"id": f"{tag}-i1", "label": "Incident", "title": "a", "source": "news", "embedding": [1.0, 0.0]},
+            {"id": f"{tag}-i2", "label": "Incident", "title": "b", "source": "reddit", "embedding": [1.0, 0.0]},
+            {"id": f"{tag}-c1", "label": "EventCluster", "title": "c", "embedding": [1.0, 0.0]},
+        ]
+        row = build_cluster(members, tag, "traffic", "smoke summary", "smoke")
+        write_all_clusters(session, [row])
+
+        new_id = row["props"]["id"]
+        left = session.run("""
+            MATCH (n) WHERE n.id IN [$tag + '-i1', $tag + '-i2', $tag + '-c1'] AND NOT n:AbsorbedIncident
+            RETURN count(n) AS n
+        """, tag=tag).single()["n"]
+        tombstones = session.run("""
+            MATCH (a:AbsorbedIncident) WHERE a.id IN [$tag + '-i1', $tag + '-i2'] RETURN count(a) AS n
+        """, tag=tag).single()["n"]
+        moved = session.run("""
+            MATCH (:Incident {id: $tag + '-i3'})-[:PART_OF]->(c:EventCluster {id: $id}) RETURN count(c) AS n
+        """, tag=tag, id=new_id).single()["n"]
+        session.run("""
+            MATCH (n) WHERE n.id STARTS WITH $tag OR n.id = $id DETACH DELETE n
+        """, tag=tag, id=new_id).consume()
+
+    assert left == 0, f"{left} members were not absorbed"
+    assert tombstones == 2, "absorbed incidents left no tombstone"
+    assert moved == 1, "incident of merged cluster was not moved to the new cluster"
+    print("✅ dedup_writer smoke test passed")
+
+
+if __name__ == "__main__":
+    if "--smoke" in sys.argv:
+        smoke_test()
@@ -1,25 +1,76 @@
 import os
-import uuid
+import sys
+import time
+import atexit
+import multiprocessing
+from contextlib import contextmanager
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
 
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer, util
-import google.generativeai as genai
+import numpy as np
 from dotenv import load_dotenv
+import neo4j_client as db
+from dedup_clustering import centroid, centroid_scores, cluster_embeddings
+from dedup_writer import build_cluster, member_event_ids, write_all_clusters, write_summaries
+from dedup_queries import (ALL_ITEMS_QUERY, UNEMBEDDED_ITEMS_QUERY, BUCKET_ITEMS_QUERY,
+                           PARTIAL_BUCKET_ITEMS_QUERY)
+from dedup_encoder import MODEL_NAME, EMBEDDING_DIM, get_encoder
+from embedding_cache import EmbeddingCache, normalize_title
+from summary_cache import SummaryCache
+from graph_schema import ensure_schema
 
 # --- Load credentials ---
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-gemini_model = genai.GenerativeModel("gemini-1.5-pro")
+GEMINI_MODEL = "gemini-1.5-pro"
+_gemini_model = None
 
-# Neo4j config
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USER = os.getenv("NEO4J_USER")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+def get_gemini_model():
+    global _gemini_model
+    if _gemini_model is None:
+        import google.generativeai as genai  # deferred: costly import, not needed for no-op runs
 
-# Embedding model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+    return _gemini_model
+
+# Embedding model (loaded on first encode, see dedup_encoder)
+# Stored next to every persisted embedding; bump it whenever the model or the
+# text that gets embedded changes so stale vectors are re-encoded. The ONNX
+# backend shares the tag because exports are validated against PyTorch.
+EMBEDDING_VERSION = f"{MODEL_NAME}:v1"
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "200000"))
+# New vectors reach disk at most this often, and once more at the end of a run or process.
+EMBEDDING_CACHE_FLUSH_S = float(os.getenv("EMBEDDING_CACHE_FLUSH_S", "30"))
+_embedding_cache = None
+
+SIMILARITY_THRESHOLD = 0.7
+# Only items published within this many hours of each other can be merged.
+TIME_WINDOW_S = float(os.getenv("DEDUP_TIME_WINDOW_HOURS", "48")) * 3600
+MIN_CLUSTER_SIZE = 3
+# Buckets smaller than this are clustered in-process; pickling them costs more than it saves.
+POOL_MIN_BUCKET = 500
+CLUSTER_WORKERS = int(os.getenv("DEDUP_CLUSTER_WORKERS", str(os.cpu_count() or 1)))
+
+_timings = {}
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _timings[name] = _timings.get(name, 0.0) + elapsed
+        print(f"[⏱️] {name}: {elapsed:.2f}s")
+
+def print_timings():
+    total = sum(_timings.values()) or 1.0
+    print("[⏱️] Phase timings:")
+    for name, elapsed in _timings.items():
+        print(f"     {name:<10} {elapsed:8.2f}s  {100 * elapsed / total:5.1f}%")
 
 def summarize_titles(titles, event_type, jurisdiction):
     prompt = f"""
@@ -33,28 +84,201 @@ Here are the event titles:
 Write a 2-3 sentence citizen-facing summary of what likely happened. Be concise and specific.
 """
     try:
-        response = gemini_model.generate_content(prompt)
+        response = get_gemini_model().generate_content(prompt)
         return response.text.strip()
     except Exception as e:
         print(f"⚠️ Gemini error: {e}")
         return None
 
+class RateLimiter:
+    """Spaces calls at least 60/per_minute seconds apart across threads."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+SUMMARY_CONCURRENCY = int(os.getenv("DEDUP_SUMMARY_CONCURRENCY", "8"))
+SUMMARY_RATE_PER_MINUTE = int(os.getenv("DEDUP_SUMMARY_RATE_PER_MINUTE", "60"))
+
+SUMMARY_CACHE_FILE = os.getenv("DEDUP_SUMMARY_CACHE", ".summary_cache.json")
+# Re-summarize only when more than this fraction of a cluster's events changed.
+SUMMARY_MAX_CHURN = float(os.getenv("DEDUP_SUMMARY_MAX_CHURN", "0.2"))
+_summary_cache = None
+_summary_stats = {"clusters": 0, "reused": 0}
+
+def get_summary_cache():
+    global _summary_cache
+    if _summary_cache is None:
+        _summary_cache = SummaryCache(SUMMARY_CACHE_FILE, max_churn=SUMMARY_MAX_CHURN)
+    return _summary_cache
+
+def summarize_clusters(jobs, concurrency=SUMMARY_CONCURRENCY, per_minute=SUMMARY_RATE_PER_MINUTE):
+    """Summaries for [(cluster, jurisdiction, event_type), ...], requested in parallel
+    under a shared rate limit, returned in job order. Clusters whose membership
+    is unchanged (or changed by at most SUMMARY_MAX_CHURN) reuse their cached
+    summary. Runs before any write transaction is opened."""
+    return summarize_memberships([
+        (member_event_ids(cluster), [e["title"] for e in cluster if e.get("title")], jurisdiction, event_type)
+        for cluster, jurisdiction, event_type in jobs
+    ], concurrency, per_minute)
+
+def summarize_memberships(jobs, concurrency=SUMMARY_CONCURRENCY, per_minute=SUMMARY_RATE_PER_MINUTE):
+    """summarize_clusters() for [(event_ids, titles, jurisdiction, event_type), ...]."""
+    if not jobs:
+        return []
+    cache = get_summary_cache()
+    summaries = [cache.get(ids, event_type, jurisdiction) for ids, _, jurisdiction, event_type in jobs]
+    todo = [i for i, summary in enumerate(summaries) if summary is None]
+    _summary_stats["clusters"] += len(jobs)
+    _summary_stats["reused"] += len(jobs) - len(todo)
+    print(f"[♻️] Summary cache: {len(jobs) - len(todo)} reused, {len(todo)} to generate")
+    if not todo:
+        return summaries
+
+    limiter = RateLimiter(per_minute)
+
+    def summarize(job):
+        _, titles, jurisdiction, event_type = job
+        limiter.wait()
+        return summarize_titles(titles, event_type, jurisdiction)
+
+    print(f"[✍️] Summarizing {len(todo)} clusters ({concurrency} in flight, {per_minute}/min)")
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(todo)))) as pool:
+        fresh = list(pool.map(summarize, [jobs[i] for i in todo]))
+    for i, summary in zip(todo, fresh):
+        if summary:
+            ids, _, jurisdiction, event_type = jobs[i]
+            cache.put(ids, event_type, jurisdiction, summary)
+        summaries[i] = summary or "Summary unavailable."
+    cache.flush()
+    return summaries
+
 def fetch_all_items(tx):
     print("[🔍] Fetching all incidents and clusters with titles")
-    result = tx.run("""
-        MATCH (n)
-        WHERE (n:Incident OR n:EventCluster) AND (n.title_sample IS NOT NULL OR n.title IS NOT NULL)
-        RETURN n.id AS id, 
-               COALESCE(n.title_sample, n.title) AS title,
-               n.source AS source, 
-               n.event_type AS event_type, 
-               n.jurisdiction AS jurisdiction, 
-               labels(n)[0] AS label
-    """)
+    result = tx.run(ALL_ITEMS_QUERY, model=EMBEDDING_VERSION)
     records = [record.data() for record in result]
     print(f"[📥] Retrieved {len(records)} items (incidents + clusters)")
     return records
 
+def fetch_unembedded_items(tx):
+    """Incidents and clusters whose stored embedding is missing, from another model, or for an old title."""
+    result = tx.run(UNEMBEDDED_ITEMS_QUERY, model=EMBEDDING_VERSION)
+    records = [record.data() for record in result]
+    print(f"[📥] Retrieved {len(records)} new or changed items")
+    return records
+
+def fetch_bucket_items(tx, buckets, since=None):
+    """Embedded items (incidents and clusters) in the given (jurisdiction, event_type) buckets,
+    limited to those published at or after `since` (ISO string) when given. Undated items are kept."""
+    complete = [[j, t] for j, t in buckets if j and t]
+    partial = [[j or "", t or ""] for j, t in buckets if not (j and t)]
+    records = []
+    for query, rows in ((BUCKET_ITEMS_QUERY, complete), (PARTIAL_BUCKET_ITEMS_QUERY, partial)):
+        if rows:
+            result = tx.run(query, model=EMBEDDING_VERSION, since=since, buckets=rows)
+            records.extend(record.data() for record in result)
+    return records
+
+def store_embeddings(tx, items):
+    for label in ("Incident", "EventCluster"):
+        rows = [
+            {"id": e["id"], "embedding": [float(x) for x in e["embedding"]], "title": e["title"]}
+            for e in items if e["label"] == label
+        ]
+        if not rows:
+            continue
+        tx.run(f"""
+            UNWIND $rows AS row
+            MATCH (n:{label} {{id: row.id}})
+            SET n.embedding = row.embedding,
+                n.embedding_model = $model,
+                n.embedding_title = row.title
+        """, rows=rows, model=EMBEDDING_VERSION)
+
+def get_embedding_cache():
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            EMBEDDING_CACHE_DIR,
+            dim=EMBEDDING_DIM,
+            version=EMBEDDING_VERSION,
+            capacity=EMBEDDING_CACHE_SIZE,
+            flush_interval=EMBEDDING_CACHE_FLUSH_S,
+        )
+        atexit.register(flush_embedding_cache)
+    return _embedding_cache
+
+def flush_embedding_cache():
+    if _embedding_cache is not None:
+        _embedding_cache.flush()
+
+def encode_titles(titles):
+    """Unit-normalized float32 embeddings, one row per title.
+    The on-disk cache is consulted first; only distinct misses are encoded."""
+    if not titles:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    cache = get_embedding_cache()
+    vectors, missing = cache.get_many(titles)
+    if missing:
+        unique = {}
+        for i in missing:
+            unique.setdefault(normalize_title(titles[i]), titles[i])
+        fresh = get_encoder().encode(list(unique.values()))
+        cache.put_many(list(unique.values()), fresh)
+        cache.maybe_flush()
+        by_key = dict(zip(unique.keys(), fresh))
+        for i in missing:
+            vectors[i] = by_key[normalize_title(titles[i])]
+    print(f"[💾] Embedding cache: {len(titles) - len(missing)} hits, {len(missing)} misses")
+    return np.stack(vectors)
+
+def embed_items(items):
+    """Fill in `embedding` for items that lack a current one; returns the items that were encoded."""
+    missing = [e for e in items if e.get("embedding") is None and e.get("title")]
+    if missing:
+        print(f"[🧮] Encoding {len(missing)} titles ({len(items) - len(missing)} reused)")
+        vectors = encode_titles([e["title"] for e in missing])
+        for item, vector in zip(missing, vectors):
+            item["embedding"] = vector
+    for item in items:
+        if item.get("embedding") is not None:
+            item["embedding"] = np.asarray(item["embedding"], dtype=np.float32)
+    return missing
+
+def to_epoch(value):
+    """Epoch seconds for an ISO string or Neo4j/python datetime; NaN when unknown."""
+    if value is None:
+        return float("nan")
+    if hasattr(value, "to_native"):
+        value = value.to_native()
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return float("nan")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def item_features(items):
+    """(embeddings, times, coords) arrays for clusterable items."""
+    embeddings = np.stack([e["embedding"] for e in items])
+    times = np.array([to_epoch(e.get("published")) for e in items], dtype=np.float64)
+    coords = np.array([
+        [e["lat"], e["lng"]] if e.get("lat") is not None and e.get("lng") is not None else [np.nan, np.nan]
+        for e in items
+    ], dtype=np.float64)
+    return embeddings, times, coords
+
 def group_by_bucket(items):
     buckets = {}
     for item in items:
@@ -63,115 +287,254 @@ def group_by_bucket(items):
     print(f"[📊] Grouped into {len(buckets)} buckets")
     return buckets
 
-def deduplicate_cluster(items, threshold=0.7):
-    titles = [e["title"] for e in items if e["title"]]
-    embeddings = model.encode(titles, convert_to_tensor=True)
-    clusters = []
-    used = set()
+def clusterable(items):
+    return [e for e in items if e.get("title") and e.get("embedding") is not None]
 
-    print(f"[🧠] Deduplicating {len(items)} items with similarity threshold {threshold}")
-    for i in range(len(items)):
-        if i in used or not items[i]["title"]:
-            continue
-        cluster = [items[i]]
-        used.add(i)
-        cos_scores = util.pytorch_cos_sim(embeddings[i], embeddings)[0]
-        for j in range(i + 1, len(items)):
-            if j not in used and items[j]["title"] and cos_scores[j] > threshold:
-                cluster.append(items[j])
-                used.add(j)
-        if len(cluster) >= 3:
-            clusters.append(cluster)
-            print(f"  ✅ Cluster of size {len(cluster)} with sample: {cluster[0]['title'][:60]}")
+def log_clusters(clusters):
+    for cluster in clusters:
+        print(f"  ✅ Cluster of size {len(cluster)} with sample: {cluster[0]['title'][:60]}")
     print(f"[🔁] Total clusters formed: {len(clusters)}")
-    return clusters
 
-def create_event_cluster(tx, cluster, jurisdiction, event_type):
-    sources = list({e.get("source", "unknown") for e in cluster if e.get("source")})
-    ids = [e["id"] for e in cluster if e.get("id")]
-    labels = [e["label"] for e in cluster if e.get("label")]
-    titles = [e["title"] for e in cluster if e.get("title")]
+def deduplicate_cluster(items, threshold=SIMILARITY_THRESHOLD):
+    items = clusterable(items)
+    if len(items) < MIN_CLUSTER_SIZE:
+        return []
+
+    print(f"[🧠] Deduplicating {len(items)} items with similarity threshold {threshold}")
+    embeddings, times, coords = item_features(items)
+    clusters = [
+        [items[i] for i in members]
+        for members in cluster_embeddings(embeddings, threshold, min_size=MIN_CLUSTER_SIZE,
+                                          times=times, coords=coords, window=TIME_WINDOW_S)
+    ]
+    log_clusters(clusters)
+    return clusters
 
-    summary = summarize_titles(titles, event_type, jurisdiction)
-    if not summary:
-        summary = "Summary unavailable."
+def deduplicate_buckets(grouped, threshold=SIMILARITY_THRESHOLD, workers=CLUSTER_WORKERS):
+    """Cluster every bucket; large buckets are farmed out to a process pool.
+    Returns {bucket: clusters}."""
+    results = {}
+    large = {}
+    for key, group in grouped.items():
+        group = clusterable(group)
+        if len(group) >= POOL_MIN_BUCKET and workers > 1:
+            large[key] = group
+        else:
+            results[key] = deduplicate_cluster(group, threshold)
 
-    summary_title = titles[0] if titles else "Untitled Cluster"
-    cluster_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    if large:
+        print(f"[🧵] Clustering {len(large)} large buckets on {min(workers, len(large))} processes")
+        # spawn, not fork: the parent may hold torch/ONNX thread pools.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(large)), mp_context=context) as pool:
+            futures = {}
+            for key, group in large.items():
+                embeddings, times, coords = item_features(group)
+                futures[key] = pool.submit(cluster_embeddings, embeddings, threshold, MIN_CLUSTER_SIZE,
+                                           times=times, coords=coords, window=TIME_WINDOW_S)
+            for key, future in futures.items():
+                group = large[key]
+                results[key] = [[group[i] for i in members] for members in future.result()]
+                print(f"\n=== Bucket: {key[0] or 'Unknown'} - {key[1]} ({len(group)} items) ===")
+                log_clusters(results[key])
+    return results
 
-    print(f"[📌] Creating cluster: {cluster_id}")
-    print(f"     Jurisdiction: {jurisdiction or 'Unknown'}, Event Type: {event_type}")
+def assign_to_centroids(new_items, clusters, threshold=SIMILARITY_THRESHOLD):
+    """Match new incidents against existing clusters in the same bucket, scored
+    like pair edges (text minus time and distance penalties against the
+    cluster's latest time and mean location).
+    Returns ({cluster_id: [items]}, unassigned_items)."""
+    if not clusters or not new_items:
+        return {}, list(new_items)
+    centroids, cluster_times, cluster_coords = item_features(clusters)
+    assigned, leftover = {}, []
+    for item in new_items:
+        _, item_time, item_coords = item_features([item])
+        scores = centroid_scores(item["embedding"], item_time[0], item_coords[0],
+                                 centroids, cluster_times, cluster_coords, TIME_WINDOW_S)
+        best = int(np.argmax(scores))
+        if scores[best] > threshold:
+            assigned.setdefault(clusters[best]["id"], []).append(item)
+        else:
+            leftover.append(item)
+    return assigned, leftover
 
+def attach_to_cluster(tx, cluster, members):
+    """Fold new incidents into an existing EventCluster and move its centroid.
+    Ids the cluster already holds are not added (or weighted) again.
+    Returns the cluster's new membership for refresh_summaries(), or None if
+    the cluster is gone."""
+    record = tx.run("""
+        MATCH (c:EventCluster {id: $cluster_id})
+        RETURN coalesce(c.event_count, 1) AS count, coalesce(c.event_ids, []) AS event_ids,
+               coalesce(c.merged_titles, []) AS titles
+    """, cluster_id=cluster["id"]).single()
+    if not record:
+        return None
+    known = set(record["event_ids"])
+    fresh = list({e["id"]: e for e in members if e["id"] not in known}.values())
+    event_ids, titles = record["event_ids"], record["titles"]
+    if fresh:
+        ids = [e["id"] for e in fresh]
+        new_titles = [e["title"] for e in fresh]
+        sources = list({e["source"] for e in fresh if e.get("source")})
+        count = record["count"]
+        new_centroid = centroid(
+            [cluster["embedding"]] + [e["embedding"] for e in fresh],
+            weights=[count] + [1] * len(fresh),
+        )
+        print(f"[➕] Adding {len(fresh)} incidents to cluster {cluster['id']}")
+        updated = tx.run("""
+            MATCH (c:EventCluster {id: $cluster_id})
+            SET c.event_ids = coalesce(c.event_ids, []) + $ids,
+                c.merged_titles = coalesce(c.merged_titles, []) + $titles,
+                c.sources = [s IN coalesce(c.sources, []) WHERE NOT s IN $sources] + $sources,
+                c.event_count = $count,
+                c.embedding = $embedding,
+                c.published = CASE WHEN c.published IS NULL OR c.published < $published
+                                   THEN $published ELSE c.published END,
+                c.updated_at = datetime()
+            RETURN c.event_ids AS event_ids, c.merged_titles AS titles
+        """,
+            cluster_id=cluster["id"],
+            ids=ids,
+            titles=new_titles,
+            sources=sources,
+            count=count + len(fresh),
+            embedding=[float(x) for x in new_centroid],
+            published=max((e["published"] for e in fresh if isinstance(e.get("published"), str)), default=None),
+        ).single()
+        event_ids, titles = updated["event_ids"], updated["titles"]
     tx.run("""
-    CREATE (c:EventCluster {
-        id: $id,
-        event_type: $event_type,
-        jurisdiction: $jurisdiction,
-        event_ids: $ids,
-        sources: $sources,
-        event_count: $count,
-        title_sample: $title_sample,
-        summary: $summary,
-        merged_titles: $titles,
-        created_at: datetime($now)
-    })
-    WITH c
-    OPTIONAL MATCH (j:Jurisdiction {name: $jurisdiction})
-    FOREACH (_ IN CASE WHEN j IS NOT NULL THEN [1] ELSE [] END |
-        MERGE (c)-[:BELONGS_TO]->(j)
-    )
-    WITH c, $ids AS item_ids, $labels AS item_labels
-    UNWIND RANGE(0, size(item_ids)-1) AS idx
-    WITH c, item_ids[idx] AS eid, item_labels[idx] AS lbl
-    CALL apoc.do.when(
-        lbl = 'Incident',
-        'MATCH (n:Incident {id: $eid}) MERGE (n)-[:PART_OF]->(c) DETACH DELETE n',
-        '
-         MATCH (n:EventCluster {id: $eid}) 
-         OPTIONAL MATCH (i:Incident)-[:PART_OF]->(n)
-         WITH $c AS newCluster, collect(i) AS incidents, n
-         UNWIND incidents AS x
-         MERGE (x)-[:PART_OF]->(c)
-         DETACH DELETE n
-        ',
-        {eid: eid, c: c}
-    ) YIELD value
-    RETURN count(*)
-""",
-    id=cluster_id,
-    event_type=event_type,
-    jurisdiction=jurisdiction,
-    ids=ids,
-    sources=sources,
-    count=len(cluster),
-    title_sample=summary_title,
-    summary=summary,
-    now=now,
-    labels=labels,
-    titles=titles  # ✅ ADD THIS LINE
-)
-
-def run_pipeline():
-    print("🚀 Starting Deduplication + Merging Pipeline")
-    with driver.session() as session:
-        try:
-            items = session.execute_read(fetch_all_items)
-            if not items:
-                print("⚠️ No data found.")
-                return
-            grouped = group_by_bucket(items)
-
-            for (jurisdiction, event_type), group in grouped.items():
-                print(f"\n=== Processing Bucket: {jurisdiction or 'Unknown'} - {event_type} ===")
-                clusters = deduplicate_cluster(group)
-                for cluster in clusters:
-                    session.execute_write(create_event_cluster, cluster, jurisdiction, event_type)
+        UNWIND $ids AS eid
+        MATCH (n:Incident {id: eid})
+        MERGE (a:AbsorbedIncident {id: n.id})
+        SET a.absorbed_at = datetime()
+        DETACH DELETE n
+    """, ids=[e["id"] for e in members])
+    return {
+        "id": cluster["id"],
+        "jurisdiction": cluster.get("jurisdiction"),
+        "event_type": cluster.get("event_type"),
+        "event_ids": event_ids,
+        "titles": [t for t in titles or [] if t],
+    }
+
+def refresh_summaries(attached):
+    """Re-summarize clusters whose membership has churned by more than
+    SUMMARY_MAX_CHURN since their summary was generated, given
+    attach_to_cluster() results. Returns rows for write_summaries()."""
+    cache = get_summary_cache()
+    stale = [a for a in attached
+             if a and cache.get(a["event_ids"], a["event_type"], a["jurisdiction"]) is None]
+    if not stale:
+        return []
+    summaries = summarize_memberships([
+        (a["event_ids"], a["titles"], a["jurisdiction"], a["event_type"]) for a in stale
+    ])
+    return [{"id": a["id"], "summary": summary} for a, summary in zip(stale, summaries)]
+
+def cluster_buckets(session, grouped):
+    with phase("cluster"):
+        results = deduplicate_buckets(grouped)
+    jobs = [
+        (cluster, jurisdiction, event_type)
+        for (jurisdiction, event_type), clusters in results.items()
+        for cluster in clusters
+    ]
+    with phase("summarize"):
+        summaries = summarize_clusters(jobs)
+    with phase("write"):
+        rows = [
+            build_cluster(cluster, jurisdiction, event_type, summary, EMBEDDING_VERSION)
+            for (cluster, jurisdiction, event_type), summary in zip(jobs, summaries)
+        ]
+        write_all_clusters(session, rows)
+
+def run_full(session):
+    with phase("fetch"):
+        items = session.execute_read(fetch_all_items)
+    if not items:
+        print("⚠️ No data found.")
+        return
+    with phase("encode"):
+        encoded = embed_items(items)
+    if encoded:
+        with phase("store"):
+            session.execute_write(store_embeddings, encoded)
+    cluster_buckets(session, group_by_bucket(items))
+
+def run_incremental(session):
+    """Encode only new/changed items, fold them into existing cluster centroids,
+    and cluster the rest against the unclustered incidents of their buckets."""
+    with phase("fetch"):
+        fresh = session.execute_read(fetch_unembedded_items)
+    if not fresh:
+        print("⚠️ No new incidents since last run.")
+        return
+    with phase("encode"):
+        encoded = embed_items(fresh)
+    if encoded:
+        with phase("store"):
+            session.execute_write(store_embeddings, encoded)
+    recluster_items(session, fresh)
 
+def recluster_items(session, fresh):
+    """Fold embedded items into the existing cluster centroids of their buckets,
+    and cluster the rest with the unclustered incidents there. Used by
+    run_incremental() and by OnlineClusterer.reconcile() for its pending pool."""
+    fresh_ids = {e["id"] for e in fresh}
+    buckets = {(e["jurisdiction"], e["event_type"]) for e in fresh if e["label"] == "Incident"}
+    # Older items can only match new ones inside the time window.
+    fresh_times = [t for t in (to_epoch(e.get("published")) for e in fresh) if not np.isnan(t)]
+    since = None
+    if fresh_times:
+        since = datetime.fromtimestamp(min(fresh_times) - TIME_WINDOW_S, timezone.utc).isoformat()
+    with phase("fetch"):
+        existing = session.execute_read(fetch_bucket_items, buckets, since)
+    with phase("encode"):
+        embed_items(existing)
+
+    grouped, attached = {}, []
+    for (jurisdiction, event_type), group in group_by_bucket(existing).items():
+        clusters = [e for e in group if e["label"] == "EventCluster"]
+        new_incidents = [e for e in group if e["label"] == "Incident" and e["id"] in fresh_ids]
+        old_incidents = [e for e in group if e["label"] == "Incident" and e["id"] not in fresh_ids]
+
+        with phase("assign"):
+            assigned, leftover = assign_to_centroids(new_incidents, clusters)
+            by_id = {c["id"]: c for c in clusters}
+            for cluster_id, members in assigned.items():
+                attached.append(session.execute_write(attach_to_cluster, by_id[cluster_id], members))
+        if leftover:
+            grouped[(jurisdiction, event_type)] = leftover + old_incidents
+
+    with phase("summarize"):
+        refreshed = refresh_summaries(attached)
+    if refreshed:
+        session.execute_write(write_summaries, refreshed)
+
+    cluster_buckets(session, grouped)
+
+def run_pipeline(incremental=True):
+    print(f"🚀 Starting Deduplication + Merging Pipeline ({'incremental' if incremental else 'full'})")
+    _timings.clear()
+    _summary_stats.update(clusters=0, reused=0)
+    with phase("schema"):
+        ensure_schema()
+    with db.session() as session:
+        try:
+            if incremental:
+                run_incremental(session)
+            else:
+                run_full(session)
         except Exception as e:
             print("❌ Pipeline error:", str(e))
+    flush_embedding_cache()
+    print_timings()
+    print(f"[♻️] Gemini calls avoided: {_summary_stats['reused']} of {_summary_stats['clusters']} cluster summaries")
 
     print("✨ Deduplication + Merge complete")
 
 if __name__ == "__main__":
-    run_pipeline()
+    run_pipeline(incremental="--full" not in sys.argv)
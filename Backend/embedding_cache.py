@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+DEFAULT_CAPACITY = 200_000
+DEFAULT_FLUSH_INTERVAL_S = 30.0
+INDEX_FORMAT = 2
+KEY_BYTES = 20  # sha1 digest
+
+
+def normalize_title(title):
+    """Case-, width- and whitespace-insensitive form of a title, used as the cache key."""
+    text = unicodedata.normalize("NFKC", title or "").lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """Memory-mapped float16 embedding store with an LRU hash index.
+
+    Vectors live in `<path>/vectors.f16` (capacity x dim), and the index
+    `<path>/index.json` maps a hash of the normalized title to its row, in
+    least- to most-recently-used order. When the store is full the least
+    recently used row is overwritten. A different `version` (model tag) or
+    `dim` discards the old contents.
+
+    Several processes may share one directory. New vectors are buffered in
+    memory and written by flush() under an exclusive lock on `<path>/.lock`:
+    it merges the index other writers saved since, assigns rows, writes the
+    vectors and replaces the index atomically. Each row also records its key
+    in `<path>/keys.bin`, so a row another process has reused since reads as
+    a miss rather than as the wrong vector. maybe_flush() writes at most
+    every `flush_interval` seconds; call flush() once at the end of a run.
+    """
+
+    def __init__(self, path, dim, version, capacity=DEFAULT_CAPACITY,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL_S):
+        self.path = path
+        self.dim = dim
+        self.version = version
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+        self._index_file = os.path.join(path, "index.json")
+        self._vectors_file = os.path.join(path, "vectors.f16")
+        self._keys_file = os.path.join(path, "keys.bin")
+        self._lock_file = os.path.join(path, ".lock")
+        self._index = OrderedDict()
+        self._generation = 0
+        self._pending = OrderedDict()  # key -> float16 vector not written yet
+        self._touched = OrderedDict()  # keys used since the last flush, oldest first
+        self._last_flush = time.monotonic()
+        with self._locked():
+            self._load()
+
+    # === Storage ===
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_file, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        if not os.path.exists(self._index_file):
+            return None
+        with open(self._index_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _compatible(self, meta):
+        return (
+            meta is not None
+            and meta.get("format") == INDEX_FORMAT
+            and meta.get("version") == self.version
+            and meta.get("dim") == self.dim
+            and meta.get("capacity") == self.capacity
+            and os.path.exists(self._vectors_file)
+            and os.path.exists(self._keys_file)
+        )
+
+    def _load(self):
+        """Open the store, resetting it if incompatible. Caller holds the lock."""
+        meta = self._read_meta()
+        compatible = self._compatible(meta)
+        mode = "r+" if compatible else "w+"
+        self._vectors = np.memmap(self._vectors_file, dtype=np.float16, mode=mode,
+                                  shape=(self.capacity, self.dim))
+        self._keys = np.memmap(self._keys_file, dtype=np.uint8, mode=mode,
+                               shape=(self.capacity, KEY_BYTES))
+        if compatible:
+            self._index = OrderedDict(meta["entries"])
+            self._generation = meta.get("generation", 0)
+        else:
+            self._index = OrderedDict()
+            self._write_index()
+
+    def _write_index(self):
+        self._generation += 1
+        tmp = self._index_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "format": INDEX_FORMAT,
+                "version": self.version,
+                "dim": self.dim,
+                "capacity": self.capacity,
+                "generation": self._generation,
+                "entries": list(self._index.items()),
+            }))
+        os.replace(tmp, self._index_file)
+
+    def _key(self, title):
+        return hashlib.sha1(normalize_title(title).encode("utf-8")).hexdigest()
+
+    def _read_row(self, slot, key):
+        """The row's vector if it still holds `key` (checked around the copy), else None."""
+        digest = bytes.fromhex(key)
+        if self._keys[slot].tobytes() != digest:
+            return None
+        vector = np.asarray(self._vectors[slot], dtype=np.float32)
+        return vector if self._keys[slot].tobytes() == digest else None
+
+    def __len__(self):
+        return len(self._index) + sum(1 for key in self._pending if key not in self._index)
+
+    # === Lookups ===
+    def get_many(self, titles):
+        """Returns (vectors, missing): vectors[i] is a float32 row or None; missing lists the None positions."""
+        vectors, missing = [], []
+        for i, title in enumerate(titles):
+            key = self._key(title)
+            vector = self._pending.get(key)
+            if vector is not None:
+                vector = vector.astype(np.float32)
+            elif key in self._index:
+                vector = self._read_row(self._index[key], key)
+            if vector is None:
+                vectors.append(None)
+                missing.append(i)
+                self.misses += 1
+            else:
+                self._touched[key] = None
+                self._touched.move_to_end(key)
+                vectors.append(vector)
+                self.hits += 1
+        return vectors, missing
+
+    def put_many(self, titles, vectors):
+        for title, vector in zip(titles, vectors):
+            key = self._key(title)
+            self._pending[key] = np.asarray(vector, dtype=np.float16)
+            self._touched[key] = None
+            self._touched.move_to_end(key)
+
+    # === Persistence ===
+    def flush(self):
+        """Write buffered vectors and recency to disk, merged with other writers' changes."""
+        if not self._pending and not self._touched:
+            return
+        with self._locked():
+            meta = self._read_meta()
+            if not self._compatible(meta):
+                self._load()
+            elif meta.get("generation") != self._generation:
+                self._index = OrderedDict(meta["entries"])
+                self._generation = meta["generation"]
+            index = self._index
+            for key in self._touched:
+                if key in index:
+                    index.move_to_end(key)
+            used = set(index.values())
+            free = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used]
+            for key, vector in self._pending.items():
+                slot = index.get(key)
+                if slot is None:
+                    slot = free.pop() if free else index.popitem(last=False)[1]
+                index[key] = slot
+                index.move_to_end(key)
+                # Invalidate the row while it is rewritten; readers check the key around their copy.
+                self._keys[slot] = 0
+                self._vectors[slot] = vector
+                self._keys[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+            self._vectors.flush()
+            self._keys.flush()
+            self._write_index()
+        self._pending.clear()
+        self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """flush() if `flush_interval` seconds have passed since the last one."""
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
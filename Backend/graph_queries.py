@@ -0,0 +1,80 @@
+# Cypher run by the ingest and lookup agents. Kept out of Agent5/Agent6 so that
+# graph_schema can EXPLAIN the real hot-path queries without importing the
+# agents (which themselves import graph_schema). See dedup_queries.py for the
+# dedup pipeline's.
+
+# === Agent5: ingest ===
+CONTAINERS_QUERY = """
+MERGE (city:City {name: $city})
+WITH city
+UNWIND $jurisdictions AS jname
+MERGE (c:Incidents {jurisdiction: jname})
+FOREACH (_ IN CASE WHEN jname = 'Unknown' THEN [1] ELSE [] END |
+    MERGE (city)-[:HAS_CONTAINER]->(c)
+)
+FOREACH (_ IN CASE WHEN jname <> 'Unknown' THEN [1] ELSE [] END |
+    MERGE (j:TrafficJurisdiction {name: jname})
+    MERGE (j)-[:PART_OF]->(city)
+    MERGE (j)-[:HAS_CONTAINER]->(c)
+)
+"""
+
+INCIDENTS_QUERY = """
+UNWIND $events AS ev
+MATCH (c:Incidents {jurisdiction: ev.props.jurisdiction})
+MERGE (i:Incident {id: ev.props.id})
+ON CREATE SET i.__created = true
+WITH c, i, ev,
+     coalesce(i.__created, false) AS created,
+     coalesce(i.content_hash, '') <> ev.hash AS changed
+REMOVE i.__created
+FOREACH (_ IN CASE WHEN changed THEN [1] ELSE [] END |
+    SET i += ev.props, i.content_hash = ev.hash
+)
+MERGE (c)-[:HAS_INCIDENT]->(i)
+WITH CASE
+    WHEN created THEN 'inserted'
+    WHEN changed THEN 'updated'
+    ELSE 'unchanged'
+END AS status, ev.props.id AS id
+RETURN status, count(*) AS n, collect(id) AS ids
+"""
+
+# Incidents folded into an EventCluster are deleted and leave a tombstone, so
+# re-ingesting an overlapping scrape does not create them again.
+ABSORBED_QUERY = """
+UNWIND $ids AS id
+MATCH (a:AbsorbedIncident {id: id})
+RETURN a.id AS id
+"""
+
+# === Agent6: lookups ===
+# === 1. Load Traffic Jurisdictions ===
+JURISDICTIONS_QUERY = """
+MATCH (j:TrafficJurisdiction)
+WHERE j.boundary IS NOT NULL
+RETURN elementId(j) AS id, j.name AS name, j.boundary AS boundary
+"""
+
+# === 3. Get Jurisdiction-Specific Incidents ===
+JURISDICTION_INCIDENTS_QUERY = """
+MATCH (i:Incident)
+WHERE i.jurisdiction = $jur_name
+RETURN i
+"""
+
+# === 4. Get City-Wide Incidents ===
+CITY_INCIDENTS_QUERY = """
+MATCH (i:Incident)
+WHERE i.city = 'Bengaluru'
+RETURN i
+"""
+
+# === Ingest_Intial_Data_Graph: wards ===
+MERGE_WARDS_QUERY = """
+UNWIND $rows AS row
+MERGE (w:Ward {name: row.name})
+SET w += row.props
+MERGE (j:TrafficJurisdiction {name: row.jurisdiction})
+MERGE (w)-[:BELONGS_TO]->(j)
+"""
@@ -0,0 +1,164 @@
+import logging
+import neo4j_client as db
+from dedup_queries import (UNEMBEDDED_ITEMS_QUERY, BUCKET_ITEMS_QUERY, CREATE_CLUSTERS_QUERY,
+                           INCIDENT_MEMBERS_QUERY, CLUSTER_MEMBERS_QUERY)
+from graph_queries import (CONTAINERS_QUERY, INCIDENTS_QUERY, ABSORBED_QUERY, JURISDICTIONS_QUERY,
+                           JURISDICTION_INCIDENTS_QUERY, CITY_INCIDENTS_QUERY, MERGE_WARDS_QUERY)
+
+logging.basicConfig(level=logging.INFO)
+
+# === Migrations ===
+# Each entry is (version, statements). Statements must be idempotent so a
+# half-applied migration can simply be re-run. Append new versions; never
+# edit one that has shipped.
+
+# Graphs written before incidents were upserted hold several Incident nodes per
+# id, and the unique constraint cannot be created over them. v1 therefore first
+# folds each set of duplicates into its oldest node: relationships move over,
+# properties are taken newest-last, and the rest are deleted. On graphs without
+# duplicates these statements match nothing, so adding them to v1 is safe:
+# graphs that had duplicates never got past v1.
+_DUPLICATE_INCIDENTS = """
+MATCH (i:Incident) WHERE i.id IS NOT NULL
+WITH i ORDER BY elementId(i)
+WITH i.id AS id, collect(i) AS nodes
+WHERE size(nodes) > 1
+WITH head(nodes) AS keep, tail(nodes) AS dups
+UNWIND dups AS dup
+"""
+
+MERGE_DUPLICATE_INCIDENTS = [
+    _DUPLICATE_INCIDENTS + """
+    MATCH (c)-[r:HAS_INCIDENT]->(dup)
+    MERGE (c)-[:HAS_INCIDENT]->(keep)
+    DELETE r
+    """,
+    _DUPLICATE_INCIDENTS + """
+    MATCH (dup)-[r:PART_OF]->(c)
+    MERGE (keep)-[:PART_OF]->(c)
+    DELETE r
+    """,
+    _DUPLICATE_INCIDENTS + """
+    SET keep += properties(dup)
+    DETACH DELETE dup
+    """,
+]
+
+MIGRATIONS = [
+    (1, MERGE_DUPLICATE_INCIDENTS + [
+        "CREATE CONSTRAINT incident_id IF NOT EXISTS FOR (i:Incident) REQUIRE i.id IS UNIQUE",
+        "CREATE CONSTRAINT event_cluster_id IF NOT EXISTS FOR (c:EventCluster) REQUIRE c.id IS UNIQUE",
+        "CREATE INDEX incident_jurisdiction IF NOT EXISTS FOR (i:Incident) ON (i.jurisdiction)",
+        "CREATE INDEX incident_city IF NOT EXISTS FOR (i:Incident) ON (i.city)",
+        "CREATE INDEX incidents_jurisdiction IF NOT EXISTS FOR (c:Incidents) ON (c.jurisdiction)",
+        "CREATE INDEX traffic_jurisdiction_name IF NOT EXISTS FOR (j:TrafficJurisdiction) ON (j.name)",
+        "CREATE INDEX jurisdiction_name IF NOT EXISTS FOR (j:Jurisdiction) ON (j.name)",
+        "CREATE INDEX ward_name IF NOT EXISTS FOR (w:Ward) ON (w.name)",
+        "CREATE INDEX city_name IF NOT EXISTS FOR (c:City) ON (c.name)",
+    ]),
+    # Incremental dedup: bucket lookups and the active-cluster/model filters.
+    (2, [
+        "CREATE INDEX incident_bucket IF NOT EXISTS FOR (i:Incident) ON (i.jurisdiction, i.event_type)",
+        "CREATE INDEX event_cluster_bucket IF NOT EXISTS FOR (c:EventCluster) ON (c.jurisdiction, c.event_type)",
+        "CREATE INDEX incident_embedding_model IF NOT EXISTS FOR (i:Incident) ON (i.embedding_model)",
+        "CREATE INDEX event_cluster_embedding_model IF NOT EXISTS FOR (c:EventCluster) ON (c.embedding_model)",
+    ]),
+    # Tombstones of incidents absorbed into clusters, backfilled from cluster event_ids.
+    (3, [
+        "CREATE CONSTRAINT absorbed_incident_id IF NOT EXISTS FOR (a:AbsorbedIncident) REQUIRE a.id IS UNIQUE",
+        """
+        MATCH (c:EventCluster) WHERE c.event_ids IS NOT NULL
+        UNWIND c.event_ids AS eid
+        WITH DISTINCT eid
+        WHERE NOT EXISTS { MATCH (:Incident {id: eid}) } AND NOT EXISTS { MATCH (:EventCluster {id: eid}) }
+        MERGE (a:AbsorbedIncident {id: eid})
+        ON CREATE SET a.absorbed_at = datetime()
+        """,
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# The agents' own queries, EXPLAINed by explain_queries().
+LOOKUP_QUERIES = {
+    "Agent5.upsert_incidents_batch": INCIDENTS_QUERY,
+    "Agent5.upsert_incidents_batch(absorbed)": ABSORBED_QUERY,
+    "Agent5.ensure_containers_batch": CONTAINERS_QUERY,
+    "Agent6.load_jurisdictions": JURISDICTIONS_QUERY,
+    "Agent6.get_incidents_by_jurisdiction_name": JURISDICTION_INCIDENTS_QUERY,
+    "Agent6.get_city_incidents": CITY_INCIDENTS_QUERY,
+    "dedup_writer.write_clusters": CREATE_CLUSTERS_QUERY,
+    "dedup_writer.write_clusters(incidents)": INCIDENT_MEMBERS_QUERY,
+    "dedup_writer.write_clusters(clusters)": CLUSTER_MEMBERS_QUERY,
+    "deduplication_agent.fetch_unembedded_items": UNEMBEDDED_ITEMS_QUERY,
+    "deduplication_agent.fetch_bucket_items": BUCKET_ITEMS_QUERY,
+    "ingestwards.merge_wards": MERGE_WARDS_QUERY,
+}
+
+_applied = False
+
+
+def get_schema_version(tx):
+    record = tx.run("MATCH (s:SchemaVersion {id: 'graph'}) RETURN s.version AS version").single()
+    return record["version"] if record else 0
+
+
+def set_schema_version(tx, version):
+    tx.run("""
+        MERGE (s:SchemaVersion {id: 'graph'})
+        SET s.version = $version, s.updated_at = datetime()
+    """, version=version)
+
+
+def apply_migrations(driver):
+    """Apply every migration newer than the stored version; returns the resulting version."""
+    with driver.session(database=db.NEO4J_DATABASE) as session:
+        current = session.execute_read(get_schema_version)
+        for version, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            logging.info(f"🧱 Applying graph schema migration v{version}")
+            for statement in statements:
+                # Schema commands cannot share a transaction with data writes.
+                session.run(statement).consume()
+            session.execute_write(set_schema_version, version)
+            current = version
+    logging.info(f"✅ Graph schema at v{current}")
+    return current
+
+
+def ensure_schema(driver=None):
+    """Run migrations once per process. Call this at service/agent startup."""
+    global _applied
+    if _applied:
+        return
+    apply_migrations(driver or db.get_driver())
+    _applied = True
+
+
+def _plan_operators(plan):
+    ops = [plan.get("operatorType", "")]
+    for child in plan.get("children", []):
+        ops.extend(_plan_operators(child))
+    return ops
+
+
+def explain_queries(driver, queries=None):
+    """EXPLAIN each query and report whether its plan is index-backed or a label scan."""
+    queries = queries or LOOKUP_QUERIES
+    report = {}
+    with driver.session(database=db.NEO4J_DATABASE) as session:
+        for name, query in queries.items():
+            summary = session.run("EXPLAIN " + query).consume()
+            ops = _plan_operators(summary.plan or {})
+            uses_index = any("Index" in op for op in ops)
+            report[name] = {"uses_index": uses_index, "operators": ops}
+    return report
+
+
+if __name__ == "__main__":
+    ensure_schema()
+    for name, info in explain_queries(db.get_driver()).items():
+        mark = "✅ index" if info["uses_index"] else "⚠️ scan "
+        print(f"{mark}  {name}: {' <- '.join(info['operators'])}")
+    db.close()
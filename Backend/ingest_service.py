@@ -0,0 +1,175 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+
+import Agent5
+import neo4j_client as db
+
+logging.basicConfig(level=logging.INFO)
+
+# The managed transaction already retries these for NEO4J_MAX_RETRY_TIME;
+# the service adds a slower outer retry so a batch survives longer outages.
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+
+class IngestService:
+    """Write-behind ingest: events are queued, coalesced into micro-batches and
+    committed one transaction per batch using Agent5's batched upsert.
+
+    A batch is flushed when it reaches `batch_size` events or when
+    `flush_interval` seconds have passed since its first event arrived.
+    `on_commit(events)`, if given, is called from the writer thread after each
+    committed batch, with each event's upsert `status` set; it should return
+    quickly (e.g. OnlineClusterer.submit, which only queues the batch).
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0,
+                 max_queue=10000, max_retries=3, retry_backoff=0.5, on_commit=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_commit = on_commit
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self._totals = {
+            "batches": 0, "events": 0, "failed_batches": 0, "retries": 0,
+            "inserted": 0, "updated": 0, "unchanged": 0, "absorbed": 0,
+        }
+
+    # === Lifecycle ===
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self
+        Agent5.ensure_schema()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+        logging.info(f"🚚 Ingest service started (batch={self.batch_size}, flush={self.flush_interval}s)")
+        return self
+
+    def stop(self, timeout=None):
+        """Stop accepting work and flush whatever is still queued."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        logging.info("🛑 Ingest service stopped")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # === Producers ===
+    def submit(self, event, block=True, timeout=None):
+        """Queue one event. Blocks (backpressure) when the queue is full."""
+        if self._stop.is_set():
+            raise RuntimeError("Ingest service is stopped")
+        self._queue.put(event, block=block, timeout=timeout)
+
+    def submit_many(self, events):
+        for event in events:
+            self.submit(event)
+
+    # === Metrics ===
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            totals = dict(self._totals)
+        stats = {"queue_depth": self._queue.qsize(), **totals}
+        if latencies:
+            stats["commit_ms_avg"] = round(sum(latencies) / len(latencies), 1)
+            stats["commit_ms_p95"] = round(latencies[int(0.95 * (len(latencies) - 1))], 1)
+            stats["commit_ms_max"] = round(latencies[-1], 1)
+        return stats
+
+    # === Writer ===
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        # Later versions of the same event win within a batch.
+        events = Agent5.dedupe_events(batch)
+        if not events:
+            return
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            statuses = {}
+            try:
+                counts = db.write(Agent5.upsert_incidents_batch, events, statuses=statuses)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    logging.error(f"❌ Batch of {len(events)} failed after {attempt + 1} attempts: {e}")
+                    with self._lock:
+                        self._totals["failed_batches"] += 1
+                    return
+                with self._lock:
+                    self._totals["retries"] += 1
+                time.sleep(self.retry_backoff * (2 ** attempt))
+                continue
+            except Exception as e:
+                logging.error(f"❌ Batch of {len(events)} failed: {e}")
+                with self._lock:
+                    self._totals["failed_batches"] += 1
+                return
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._latencies.append(elapsed_ms)
+                self._totals["batches"] += 1
+                self._totals["events"] += len(events)
+                for status, n in counts.items():
+                    self._totals[status] += n
+            logging.info(f"📦 Committed {len(events)} events in {elapsed_ms:.0f} ms {counts}")
+            if self.on_commit:
+                try:
+                    self.on_commit([{**e, "status": statuses.get(e["id"])} for e in events])
+                except Exception as e:
+                    logging.error(f"❌ on_commit hook failed for {len(events)} events: {e}")
+            return
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    with open(Agent5.INPUT_FILE, "r", encoding="utf-8") as f:
+        events = json.load(f)
+    clusterer = on_commit = None
+    if "--cluster" in sys.argv:
+        from online_clusterer import OnlineClusterer
+        clusterer = OnlineClusterer().load().start().start_reconciler()
+        on_commit = clusterer.submit
+    with IngestService(on_commit=on_commit) as service:
+        service.submit_many(events)
+    if clusterer:
+        clusterer.stop()
+    print(json.dumps(service.stats(), indent=2))
@@ -0,0 +1,114 @@
+import os
+import threading
+from dotenv import load_dotenv
+from neo4j import GraphDatabase, AsyncGraphDatabase
+
+# === Neo4j Setup ===
+load_dotenv()
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or None
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUIRE_TIMEOUT = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "60"))
+# Upper bound on how long a managed transaction keeps retrying transient errors.
+NEO4J_MAX_RETRY_TIME = float(os.getenv("NEO4J_MAX_RETRY_TIME", "30"))
+
+_driver = None
+_async_driver = None
+_lock = threading.Lock()
+
+
+def _driver_config():
+    return {
+        "auth": (NEO4J_USER, NEO4J_PASSWORD),
+        "max_connection_pool_size": NEO4J_MAX_POOL_SIZE,
+        "connection_acquisition_timeout": NEO4J_ACQUIRE_TIMEOUT,
+        "max_transaction_retry_time": NEO4J_MAX_RETRY_TIME,
+    }
+
+
+# === Sync API ===
+def get_driver():
+    """Process-wide pooled driver, created on first use rather than at import."""
+    global _driver
+    if _driver is None:
+        with _lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(NEO4J_URI, **_driver_config())
+    return _driver
+
+
+def session(**kwargs):
+    return get_driver().session(database=NEO4J_DATABASE, **kwargs)
+
+
+def read(work, *args, **kwargs):
+    """Run `work(tx, *args, **kwargs)` in a managed read transaction (retried on transient errors)."""
+    with session() as s:
+        return s.execute_read(work, *args, **kwargs)
+
+
+def write(work, *args, **kwargs):
+    """Run `work(tx, *args, **kwargs)` in a managed write transaction (retried on transient errors)."""
+    with session() as s:
+        return s.execute_write(work, *args, **kwargs)
+
+
+def _fetch(tx, cypher, params):
+    return [record.data() for record in tx.run(cypher, params)]
+
+
+def query(cypher, **params):
+    """Run a read query and return its records as dicts."""
+    return read(_fetch, cypher, params)
+
+
+def close():
+    global _driver
+    with _lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+# === Async API ===
+def get_async_driver():
+    """Async counterpart of get_driver() for FastAPI handlers; never blocks the event loop."""
+    global _async_driver
+    if _async_driver is None:
+        with _lock:
+            if _async_driver is None:
+                _async_driver = AsyncGraphDatabase.driver(NEO4J_URI, **_driver_config())
+    return _async_driver
+
+
+def async_session(**kwargs):
+    return get_async_driver().session(database=NEO4J_DATABASE, **kwargs)
+
+
+async def read_async(work, *args, **kwargs):
+    """`work` must be an async function taking an AsyncManagedTransaction."""
+    async with async_session() as s:
+        return await s.execute_read(work, *args, **kwargs)
+
+
+async def write_async(work, *args, **kwargs):
+    async with async_session() as s:
+        return await s.execute_write(work, *args, **kwargs)
+
+
+async def _fetch_async(tx, cypher, params):
+    result = await tx.run(cypher, params)
+    return [record.data() async for record in result]
+
+
+async def query_async(cypher, **params):
+    return await read_async(_fetch_async, cypher, params)
+
+
+async def close_async():
+    global _async_driver
+    if _async_driver is not None:
+        await _async_driver.close()
+        _async_driver = None
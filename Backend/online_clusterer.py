@@ -0,0 +1,341 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+import neo4j_client as db
+import deduplication_agent as dedup
+from dedup_clustering import centroid_scores
+from dedup_writer import build_cluster, write_clusters, write_summaries
+
+logging.basicConfig(level=logging.INFO)
+
+ACTIVE_CLUSTERS_QUERY = """
+MATCH (c:EventCluster)
+WHERE c.embedding_model = $model
+  AND coalesce(c.published, toString(c.created_at)) >= $since
+RETURN c.id AS id, c.embedding AS embedding, coalesce(c.event_count, 1) AS count,
+       c.jurisdiction AS jurisdiction, c.event_type AS event_type,
+       c.published AS published, c.lat AS lat, c.lng AS lng,
+       coalesce(c.event_ids, []) AS event_ids
+"""
+
+# Pending incidents that are still unclustered Incident nodes after a reconcile.
+UNCLUSTERED_QUERY = """
+UNWIND $ids AS id
+MATCH (i:Incident {id: id})
+RETURN i.id AS id
+"""
+
+# Worker queue markers.
+_RECONCILE = "reconcile"
+_STOP = "stop"
+
+
+class OnlineClusterer:
+    """Assigns freshly ingested incidents to active EventClusters as they arrive.
+
+    Active clusters (published inside the dedup time window) are kept in
+    memory per (jurisdiction, event_type) bucket with their centroids. A new
+    incident joins the best-scoring centroid above the similarity threshold,
+    and that centroid moves incrementally. Incidents that match nothing wait
+    in a per-bucket pending pool. Once the pool can form a cluster of
+    MIN_CLUSTER_SIZE, that cluster is written and becomes active; its
+    summary follows from a separate thread, as do new summaries for clusters
+    whose membership has churned. reconcile() re-clusters the
+    pending pool with the batch pipeline and reloads the active set, to pick
+    up anything written outside this process.
+
+    After start(), submit() only queues a committed ingest batch: assignment
+    and reconciliation run in order on the clusterer's own worker thread, so
+    the ingest writer never waits on encoding, Neo4j writes or Gemini.
+    """
+
+    def __init__(self, threshold=dedup.SIMILARITY_THRESHOLD, window=dedup.TIME_WINDOW_S,
+                 max_queue=1000, max_batch=1000):
+        self.threshold = threshold
+        self.window = window
+        self.max_batch = max_batch
+        self.active = {}    # bucket -> {cluster_id: cluster item}
+        self.pending = {}   # bucket -> [incident items]
+        # Incident ids already placed: waiting in a pending pool, or member of an active cluster.
+        self._pending_ids = set()
+        self._member_of = {}
+        # Per-bucket (items, embeddings, times, coords), rebuilt only after the bucket changes.
+        self._active_arrays = {}
+        self._pending_arrays = {}
+        # Newest publication time seen; the window slides with the stream, not the wall clock.
+        self._latest = float("-inf")
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._summarizer = None
+        self._reconciler = None
+        self._stop = threading.Event()
+
+    # === State ===
+    def load(self):
+        since = datetime.fromtimestamp(time.time() - self.window, timezone.utc).isoformat()
+        records = db.query(ACTIVE_CLUSTERS_QUERY, model=dedup.EMBEDDING_VERSION, since=since)
+        active, member_of = {}, {}
+        for rec in records:
+            rec["embedding"] = np.asarray(rec["embedding"], dtype=np.float32)
+            active.setdefault((rec["jurisdiction"], rec["event_type"]), {})[rec["id"]] = rec
+            for event_id in rec["event_ids"]:
+                member_of[event_id] = rec["id"]
+        with self._lock:
+            self.active = active
+            self._member_of = member_of
+            self._active_arrays.clear()
+        logging.info(f"🧭 Loaded {len(records)} active clusters in {len(active)} buckets")
+        return self
+
+    def _evict(self):
+        cutoff = self._latest - self.window
+        for bucket, clusters in self.active.items():
+            stale = [cid for cid, c in clusters.items() if dedup.to_epoch(c.get("published")) < cutoff]
+            for cluster_id in stale:
+                for event_id in clusters.pop(cluster_id)["event_ids"]:
+                    self._member_of.pop(event_id, None)
+            if stale:
+                self._active_arrays.pop(bucket, None)
+        for bucket, items in self.pending.items():
+            kept = [e for e in items if not dedup.to_epoch(e.get("published")) < cutoff]
+            if len(kept) < len(items):
+                self._pending_ids.difference_update(e["id"] for e in items if e not in kept)
+                self.pending[bucket] = kept
+                self._pending_arrays.pop(bucket, None)
+
+    def _activate(self, bucket, row):
+        props = row["props"]
+        self.active.setdefault(bucket, {})[props["id"]] = {
+            "id": props["id"], "count": props["event_count"],
+            "embedding": np.asarray(props["embedding"], dtype=np.float32),
+            "jurisdiction": props["jurisdiction"], "event_type": props["event_type"],
+            "published": props["published"], "lat": props["lat"], "lng": props["lng"],
+            "event_ids": list(props["event_ids"]),
+        }
+        for event_id in props["event_ids"]:
+            self._member_of[event_id] = props["id"]
+        self._active_arrays.pop(bucket, None)
+
+    # === Assignment ===
+    def _scores(self, item, arrays, bucket, candidates):
+        """(candidates, scores) of `item` against clusters or pending incidents of its bucket."""
+        if not candidates:
+            return [], np.zeros(0)
+        if bucket not in arrays:
+            arrays[bucket] = (candidates, *dedup.item_features(candidates))
+        candidates, embeddings, times, coords = arrays[bucket]
+        _, item_time, item_coords = dedup.item_features([item])
+        return candidates, centroid_scores(item["embedding"], item_time[0], item_coords[0],
+                                           embeddings, times, coords, self.window)
+
+    def _attach(self, bucket, cluster, index, item):
+        count = cluster["count"]
+        cluster["embedding"] = dedup.centroid([cluster["embedding"], item["embedding"]], weights=[count, 1])
+        cluster["count"] = count + 1
+        cluster["event_ids"].append(item["id"])
+        self._member_of[item["id"]] = cluster["id"]
+        if isinstance(item.get("published"), str):
+            cluster["published"] = max(filter(None, [cluster.get("published"), item["published"]]))
+        _, embeddings, times, _ = self._active_arrays[bucket]
+        embeddings[index] = cluster["embedding"]
+        times[index] = dedup.to_epoch(cluster.get("published"))
+
+    def _add_pending(self, bucket, item, formed):
+        """Park an unmatched incident; if it completes a cluster with its pending
+        neighbours, form that cluster now so later incidents can join it."""
+        pool = self.pending.setdefault(bucket, [])
+        candidates, scores = self._scores(item, self._pending_arrays, bucket, pool)
+        neighbours = [candidates[i] for i in np.nonzero(scores > self.threshold)[0]]
+        # One entry per incident, whatever the pool holds.
+        group = list({e["id"]: e for e in neighbours + [item]}.values())
+        consumed = set()
+        if len(group) >= dedup.MIN_CLUSTER_SIZE:
+            for members in dedup.deduplicate_cluster(group, self.threshold):
+                # Written without a summary; _summarize() fills it in afterwards.
+                row = build_cluster(members, bucket[0], bucket[1], None, dedup.EMBEDDING_VERSION)
+                formed.append((bucket, members, row))
+                self._activate(bucket, row)
+                consumed.update(m["id"] for m in members)
+        if consumed:
+            pool[:] = [e for e in pool if e["id"] not in consumed]
+            self._pending_ids.difference_update(consumed)
+        if item["id"] not in consumed:
+            pool.append(item)
+            self._pending_ids.add(item["id"])
+        self._pending_arrays.pop(bucket, None)
+
+    def assign_many(self, events):
+        """Place a batch of newly ingested events; returns counts and elapsed ms.
+        Re-ingested events (upsert status 'unchanged' or 'absorbed') and incidents already
+        pending or in an active cluster are skipped."""
+        started = time.perf_counter()
+        by_id = {
+            e["id"]: {
+                "id": e["id"], "title": e.get("title"), "label": "Incident",
+                "source": e.get("source"), "event_type": e.get("event_type"),
+                "jurisdiction": e.get("jurisdiction"), "published": e.get("published"),
+                "lat": e.get("lat"), "lng": e.get("lng"), "embedding": e.get("embedding"),
+            }
+            for e in events if e.get("id") and e.get("title") and e.get("status") not in ("unchanged", "absorbed")
+        }
+        with self._lock:
+            items = [e for e in by_id.values() if e["id"] not in self._pending_ids and e["id"] not in self._member_of]
+        if not items:
+            return {"attached": 0, "created": 0, "pending": 0, "ms": 0.0}
+        encoded = dedup.embed_items(items)
+        if encoded:
+            db.write(dedup.store_embeddings, encoded)
+
+        attached, formed = {}, []
+        with self._lock:
+            for item in items:
+                published = dedup.to_epoch(item.get("published"))
+                if published > self._latest:
+                    self._latest = published
+            self._evict()
+            for item in items:
+                bucket = (item["jurisdiction"], item["event_type"])
+                clusters = list(self.active.get(bucket, {}).values())
+                candidates, scores = self._scores(item, self._active_arrays, bucket, clusters)
+                best = int(np.argmax(scores)) if len(scores) else None
+                if best is not None and scores[best] > self.threshold:
+                    cluster = candidates[best]
+                    attached.setdefault(cluster["id"], (dict(cluster), []))[1].append(item)
+                    self._attach(bucket, cluster, best, item)
+                else:
+                    self._add_pending(bucket, item, formed)
+
+        if formed:
+            db.write(write_clusters, [row for _, _, row in formed])
+        # After the new clusters exist, so incidents can also join clusters formed in this batch.
+        memberships = [db.write(dedup.attach_to_cluster, snapshot, members)
+                       for snapshot, members in attached.values()]
+        jobs = [(members, bucket[0], bucket[1]) for bucket, members, _ in formed]
+        cluster_ids = [row["props"]["id"] for _, _, row in formed]
+        if formed or any(memberships):
+            if self._summarizer:
+                self._summarizer.submit(self._summarize, jobs, cluster_ids, memberships)
+            else:
+                self._summarize(jobs, cluster_ids, memberships)
+
+        elapsed = (time.perf_counter() - started) * 1000
+        stats = {
+            "attached": sum(len(m) for _, m in attached.values()),
+            "created": len(formed),
+            "pending": len(self._pending_ids),
+            "ms": round(elapsed, 1),
+        }
+        logging.info(f"🧲 Online clustering: {stats}")
+        return stats
+
+    def _summarize(self, jobs, cluster_ids, memberships):
+        """Summaries for newly formed clusters, and new ones for grown clusters
+        whose membership churned past SUMMARY_MAX_CHURN."""
+        try:
+            summaries = dedup.summarize_clusters(jobs)
+            rows = [{"id": cid, "summary": s} for cid, s in zip(cluster_ids, summaries)]
+            rows += dedup.refresh_summaries(memberships)
+            if rows:
+                db.write(write_summaries, rows)
+        except Exception as e:
+            logging.error(f"❌ Cluster summaries failed: {e}")
+
+    # === Worker ===
+    def start(self):
+        """Run assignment on a worker thread fed by submit(), and summaries on another."""
+        if self._worker and self._worker.is_alive():
+            return self
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cluster-summaries")
+        self._worker = threading.Thread(target=self._run, name="online-clusterer", daemon=True)
+        self._worker.start()
+        return self
+
+    def submit(self, events):
+        """Queue a committed ingest batch (IngestService's on_commit hook); returns at once.
+        If the queue is full the batch is left to the reconciler's incremental run."""
+        try:
+            self._queue.put_nowait(list(events))
+        except queue.Full:
+            logging.warning(f"⚠️ Clusterer queue full; {len(events)} events left for reconciliation")
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            events = []
+            # Coalesce queued batches into one assignment pass.
+            while isinstance(job, list):
+                events.extend(job)
+                if len(events) >= self.max_batch:
+                    job = None
+                    break
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    job = None
+            if events:
+                try:
+                    self.assign_many(events)
+                except Exception as e:
+                    logging.error(f"❌ Online assignment of {len(events)} events failed: {e}")
+            if job == _RECONCILE:
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    logging.error(f"❌ Reconciliation failed: {e}")
+            elif job == _STOP:
+                return
+
+    # === Reconciliation ===
+    def reconcile(self):
+        """Run the incremental pipeline for items written elsewhere, then re-cluster
+        the pending pool against its buckets in the graph. Must not overlap
+        assign_many(); with start(), it is queued onto the worker instead."""
+        dedup.run_pipeline(incremental=True)
+        with self._lock:
+            snapshot = [e for pool in self.pending.values() for e in pool]
+        if snapshot:
+            with db.session() as session:
+                dedup.recluster_items(session, snapshot)
+            ids = [e["id"] for e in snapshot]
+            unclustered = {rec["id"] for rec in db.query(UNCLUSTERED_QUERY, ids=ids)}
+            reclustered = set(ids) - unclustered
+            with self._lock:
+                for bucket, pool in self.pending.items():
+                    pool[:] = [e for e in pool if e["id"] not in reclustered]
+                self._pending_ids -= reclustered
+                self._pending_arrays.clear()
+            logging.info(f"🔄 Reconciled {len(reclustered)} of {len(ids)} pending incidents into clusters")
+        self.load()
+
+    def start_reconciler(self, interval_s=900):
+        def loop():
+            while not self._stop.wait(interval_s):
+                if self._worker and self._worker.is_alive():
+                    self._queue.put(_RECONCILE)
+                    continue
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    logging.error(f"❌ Reconciliation failed: {e}")
+
+        self._stop.clear()
+        self._reconciler = threading.Thread(target=loop, name="dedup-reconciler", daemon=True)
+        self._reconciler.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the reconciler, finish queued assignments and pending summaries."""
+        self._stop.set()
+        if self._worker and self._worker.is_alive():
+            self._queue.put(_STOP)
+            self._worker.join(timeout)
+        if self._summarizer:
+            self._summarizer.shutdown(wait=True)
+            self._summarizer = None
@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+DEFAULT_CAPACITY = 50_000
+# Reuse a summary while at most this fraction of the membership (Jaccard distance) has changed.
+DEFAULT_MAX_CHURN = 0.2
+
+
+def member_key(ids, event_type, jurisdiction):
+    payload = json.dumps([jurisdiction or "", event_type or "", sorted(set(ids))])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """Cluster summaries keyed by bucket and a hash of the sorted member ids.
+
+    Each entry remembers the member set its summary was generated for. A
+    lookup first tries the exact key. If that misses, it looks for the entry
+    in the same bucket with the smallest Jaccard distance to the new
+    membership and reuses its summary when at most `max_churn` of the
+    membership has changed. Reused summaries are not re-stored under the new
+    set, so slow growth cannot drift away from what was actually summarized.
+    Stored as JSON at `path`, least recently used first.
+    """
+
+    def __init__(self, path, max_churn=DEFAULT_MAX_CHURN, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.max_churn = max_churn
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._by_member = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for key, entry in json.load(f):
+                    self._add(key, entry)
+
+    def _add(self, key, entry):
+        self._entries[key] = entry
+        for member in entry["ids"]:
+            self._by_member.setdefault((entry["bucket"], member), set()).add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for member in entry["ids"]:
+            keys = self._by_member.get((entry["bucket"], member))
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_member[(entry["bucket"], member)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, ids, event_type, jurisdiction):
+        """Cached summary for this membership, or None if it must be (re)generated."""
+        ids = set(ids)
+        bucket = f"{jurisdiction or ''}|{event_type or ''}"
+        key = member_key(ids, event_type, jurisdiction)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]["summary"]
+            shared = Counter(k for member in ids for k in self._by_member.get((bucket, member), ()))
+            best, best_churn = None, 1.0
+            for candidate, overlap in shared.items():
+                union = len(ids) + len(self._entries[candidate]["ids"]) - overlap
+                churn = 1.0 - overlap / union
+                if churn < best_churn:
+                    best, best_churn = candidate, churn
+            if best is None or best_churn > self.max_churn:
+                return None
+            self._entries.move_to_end(best)
+            return self._entries[best]["summary"]
+
+    def put(self, ids, event_type, jurisdiction, summary):
+        key = member_key(ids, event_type, jurisdiction)
+        entry = {
+            "bucket": f"{jurisdiction or ''}|{event_type or ''}",
+            "ids": sorted(set(ids)),
+            "summary": summary,
+        }
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._add(key, entry)
+            while len(self._entries) > self.capacity:
+                self._remove(next(iter(self._entries)))
+
+    def flush(self):
+        with self._lock:
+            items = list(self._entries.items())
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(items))  # one C-encoded string; json.dump streams in pure Python
+        os.replace(tmp, self.path)
@@ -0,0 +1,244 @@
+import math
+import time
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from geo import EARTH_RADIUS_KM
+
+DEFAULT_CAPACITY = 50_000
+DEFAULT_MAX_AGE_S = 7 * 24 * 3600
+# Grid cells are GRID_DEG x GRID_DEG degrees (~5.5 km of latitude).
+GRID_DEG = 0.05
+EVICT_EVERY_S = 60
+# Epoch seconds stored on every event document; the listener only selects
+# documents whose RECENCY_FIELD is inside the cache window.
+RECENCY_FIELD = "event_ts"
+# How often the listener is checked, and re-opened if it has closed.
+WATCH_CHECK_S = 10
+
+
+def parse_time(value):
+    """Epoch seconds from an ISO string, datetime, or epoch seconds/milliseconds
+    (as the app sends); None when unparseable."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is not None:
+        return number / 1000 if number > 1e11 else number
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return None
+
+
+def event_time(data, fallback=None):
+    """Epoch seconds of an event document: its `timestamp`/`datetime` field, else
+    `fallback` (a datetime), else None."""
+    for field in ("timestamp", "datetime"):
+        ts = parse_time(data.get(field))
+        if ts is not None:
+            return ts
+    if fallback is not None:
+        return fallback.timestamp()
+    return None
+
+
+def recency_fields(data, fallback=None):
+    """Fields to merge into an event document so the cache listener can select it."""
+    return {RECENCY_FIELD: event_time(data, fallback or datetime.now(timezone.utc))}
+
+
+class EventCache:
+    """Resident spatial index of recent events, kept current by a Firestore
+    snapshot listener.
+
+    Coordinates live in fixed-size NumPy arrays (one slot per event) with a
+    grid of GRID_DEG cells mapping to slots, so a radius query only runs a
+    vectorized haversine over the slots in nearby cells. Events older than
+    `max_age_s` are evicted, and the oldest event makes room when all
+    `capacity` slots are taken, so memory stays bounded.
+
+    The listener only covers documents with a recent RECENCY_FIELD. Report
+    writers set it; event_fields.FieldFiller adds it to documents written
+    without it (feed events), which then arrive here as new. If it fails or closes, `ready`
+    is cleared so queries fall back to Firestore, and it is re-opened with a
+    fresh window; its first snapshot rebuilds the index.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_age_s=DEFAULT_MAX_AGE_S):
+        self.capacity = capacity
+        self.max_age_s = max_age_s
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lng = np.zeros(capacity, dtype=np.float64)
+        self.ts = np.full(capacity, np.inf)  # inf marks a free slot
+        self.docs = [None] * capacity
+        self._slot_of = {}
+        self._cell_of = {}
+        self._grid = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        self._collection = None
+        self._watch = None
+        self._broken = False
+        self._stopped = threading.Event()
+        self._supervisor = None
+        self.ready = threading.Event()
+
+    # === Index maintenance ===
+    @staticmethod
+    def _cell(lat, lng):
+        return int(math.floor(lat / GRID_DEG)), int(math.floor(lng / GRID_DEG))
+
+    def _reset(self):
+        self.ts[:] = np.inf
+        self.docs = [None] * self.capacity
+        self._slot_of.clear()
+        self._cell_of.clear()
+        self._grid.clear()
+        self._free = list(range(self.capacity - 1, -1, -1))
+
+    def _remove(self, doc_id):
+        slot = self._slot_of.pop(doc_id, None)
+        if slot is None:
+            return
+        cell = self._cell_of.pop(slot)
+        members = self._grid[cell]
+        members.discard(slot)
+        if not members:
+            del self._grid[cell]
+        self.ts[slot] = np.inf
+        self.docs[slot] = None
+        self._free.append(slot)
+
+    def _upsert(self, doc_id, data, ts):
+        lat, lng = data.get("lat"), data.get("lng")
+        self._remove(doc_id)
+        if lat is None or lng is None or ts < time.time() - self.max_age_s:
+            return
+        if not self._free:
+            oldest = int(np.argmin(self.ts))
+            self._remove(self.docs[oldest]["_id"])
+        slot = self._free.pop()
+        cell = self._cell(lat, lng)
+        self.lat[slot], self.lng[slot], self.ts[slot] = lat, lng, ts
+        self.docs[slot] = {**data, "_id": doc_id}
+        self._slot_of[doc_id] = slot
+        self._cell_of[slot] = cell
+        self._grid.setdefault(cell, set()).add(slot)
+
+    def _evict_expired(self, now):
+        cutoff = now - self.max_age_s
+        for slot in np.nonzero(self.ts < cutoff)[0]:
+            self._remove(self.docs[slot]["_id"])
+        self._last_evict = now
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    # === Firestore listener ===
+    def _on_snapshot(self, docs, changes, read_time):
+        if self._broken:
+            return  # missed changes; wait for _supervise() to re-open the listener
+        try:
+            with self._lock:
+                if not self.ready.is_set():
+                    # First snapshot of a (re)opened listener: it carries every matching document.
+                    self._reset()
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == "REMOVED":
+                        self._remove(doc.id)
+                    else:
+                        data = doc.to_dict()
+                        ts = event_time(data, doc.create_time)
+                        self._upsert(doc.id, data, time.time() if ts is None else ts)
+                self._evict_expired(time.time())
+        except Exception as e:
+            print(f"🚨 Event cache update failed, falling back to Firestore: {e}")
+            self._broken = True
+            self.ready.clear()
+            return
+        if not self.ready.is_set():
+            print(f"🗺️ Event cache warmed up with {len(self)} events")
+            self.ready.set()
+
+    def _subscribe(self):
+        cutoff = time.time() - self.max_age_s
+        query = self._collection.where(filter=FieldFilter(RECENCY_FIELD, ">=", cutoff))
+        self._broken = False
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def _unsubscribe(self):
+        watch, self._watch = self._watch, None
+        if watch:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"⚠️ Closing event cache listener: {e}")
+
+    def _supervise(self):
+        while not self._stopped.wait(WATCH_CHECK_S):
+            if self._watch is not None and self._watch.is_active and not self._broken:
+                continue
+            print("⚠️ Event cache listener closed; re-opening it, queries fall back to Firestore")
+            self.ready.clear()
+            self._unsubscribe()
+            try:
+                self._subscribe()
+            except Exception as e:
+                print(f"🚨 Event cache listener could not be re-opened: {e}")
+
+    def start(self, collection, warmup_timeout=30.0):
+        """Subscribe to the recent events of `collection`; blocks until the first
+        snapshot (the warm-up) or timeout."""
+        self._collection = collection
+        self._stopped.clear()
+        self._subscribe()
+        self._supervisor = threading.Thread(target=self._supervise, name="event-cache-watch", daemon=True)
+        self._supervisor.start()
+        if not self.ready.wait(warmup_timeout):
+            print("⚠️ Event cache not warm yet; queries fall back to Firestore")
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.ready.clear()
+        self._unsubscribe()
+
+    # === Queries ===
+    def near(self, latitude, longitude, radius_km):
+        """[(distance_km, event dict), ...] for cached events within radius_km."""
+        d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        d_lng = d_lat / max(math.cos(math.radians(latitude)), 1e-6)
+        y0, x0 = self._cell(latitude - d_lat, longitude - d_lng)
+        y1, x1 = self._cell(latitude + d_lat, longitude + d_lng)
+        now = time.time()
+        with self._lock:
+            if now - self._last_evict > EVICT_EVERY_S:
+                self._evict_expired(now)
+            if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self._grid):
+                cells = self._grid.values()
+            else:
+                cells = [self._grid[(y, x)] for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)
+                         if (y, x) in self._grid]
+            slots = np.fromiter((s for members in cells for s in members), dtype=np.int64)
+            if not len(slots):
+                return []
+            lat1, lng1 = math.radians(latitude), math.radians(longitude)
+            lat2, lng2 = np.radians(self.lat[slots]), np.radians(self.lng[slots])
+            h = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+            dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+            hits = np.nonzero(dist <= radius_km)[0]
+            return [(float(dist[i]), self.docs[slots[i]]) for i in hits]
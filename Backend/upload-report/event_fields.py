@@ -0,0 +1,120 @@
+import sys
+import threading
+
+from geo import geohash_fields
+from event_cache import RECENCY_FIELD, WATCH_CHECK_S, recency_fields
+
+FIRESTORE_BATCH_SIZE = 400  # Firestore allows 500 writes per batch
+
+
+def missing_fields(data, create_time=None):
+    """Geohash and recency fields an event document lacks; empty when it has them
+    (or, for geohash, has no location)."""
+    fields = {}
+    if not data.get("geohash") and data.get("lat") is not None and data.get("lng") is not None:
+        fields.update(geohash_fields(data["lat"], data["lng"]))
+    if data.get(RECENCY_FIELD) is None:
+        fields.update(recency_fields(data, create_time))
+    return fields
+
+
+def update_all(db, updates):
+    """Apply [(document ref, fields), ...] in batched commits; returns how many."""
+    for start in range(0, len(updates), FIRESTORE_BATCH_SIZE):
+        batch = db.batch()
+        for ref, fields in updates[start:start + FIRESTORE_BATCH_SIZE]:
+            batch.update(ref, fields)
+        batch.commit()
+    return len(updates)
+
+
+def backfill(db):
+    """Add geohash and recency fields to event documents written before they existed."""
+    updates = []
+    for doc in db.collection("events").stream():
+        fields = missing_fields(doc.to_dict(), doc.create_time)
+        if fields:
+            updates.append((doc.reference, fields))
+    updated = update_all(db, updates)
+    print(f"🧭 Added geohash/recency fields to {updated} events")
+    return updated
+
+
+class FieldFiller:
+    """Adds missing geohash and recency fields to event documents as they are written.
+
+    Feed events are written outside this service, and /events-nearby (geohash
+    query) and the event cache (recency query) only select documents that
+    carry these fields. This listener watches the whole collection and fills
+    them in on any document that lacks them, so such events become visible
+    moments after they are written. Documents that already have the fields
+    are only read. A closed listener is re-opened like the event cache's.
+    """
+
+    def __init__(self, db, collection_name="events"):
+        self.db = db
+        self.collection = db.collection(collection_name)
+        self._watch = None
+        self._broken = False
+        self._stopped = threading.Event()
+        self._supervisor = None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        updates = []
+        for change in changes:
+            if change.type.name == "REMOVED":
+                continue
+            doc = change.document
+            fields = missing_fields(doc.to_dict() or {}, doc.create_time)
+            if fields:
+                updates.append((doc.reference, fields))
+        if not updates:
+            return
+        try:
+            print(f"🧭 Filled in geohash/recency fields on {update_all(self.db, updates)} events")
+        except Exception as e:
+            # Re-opening the listener delivers these documents again.
+            print(f"🚨 Filling in event fields failed: {e}")
+            self._broken = True
+
+    def _supervise(self):
+        while not self._stopped.wait(WATCH_CHECK_S):
+            if self._watch is not None and self._watch.is_active and not self._broken:
+                continue
+            print("⚠️ Event field listener closed; re-opening it")
+            self._unsubscribe()
+            try:
+                self._subscribe()
+            except Exception as e:
+                print(f"🚨 Event field listener could not be re-opened: {e}")
+
+    def _subscribe(self):
+        self._broken = False
+        self._watch = self.collection.on_snapshot(self._on_snapshot)
+
+    def _unsubscribe(self):
+        watch, self._watch = self._watch, None
+        if watch:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"⚠️ Closing event field listener: {e}")
+
+    def start(self):
+        self._stopped.clear()
+        self._subscribe()
+        self._supervisor = threading.Thread(target=self._supervise, name="event-field-watch", daemon=True)
+        self._supervisor.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._unsubscribe()
+
+
+if __name__ == "__main__":
+    # FIRESTORE_EMULATOR_HOST=localhost:8080 python event_fields.py --backfill
+    from google.cloud import firestore
+
+    if "--backfill" in sys.argv:
+        backfill(firestore.Client())
@@ -0,0 +1,111 @@
+import math
+import sys
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+EARTH_RADIUS_KM = 6371.0
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Every event document stores `geohash` (GEOHASH_PRECISION chars) and one
+# `geohash_<p>` prefix field per precision below, so a nearby query can select
+# whole cells with a single `in` filter at whichever precision suits the radius.
+GEOHASH_PRECISION = 9
+QUERY_PRECISIONS = (3, 4, 5, 6, 7)
+# Firestore accepts at most 30 values in one `in` filter.
+MAX_CELLS_PER_QUERY = 30
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(d_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c  # distance in kilometers
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size_deg(precision):
+    """(lat, lng) extent in degrees of a geohash cell."""
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_fields(lat, lng):
+    """Fields to merge into an event document; empty when the location is unknown."""
+    if lat is None or lng is None:
+        return {}
+    full = encode(lat, lng)
+    fields = {"geohash": full}
+    for p in QUERY_PRECISIONS:
+        fields[f"geohash_{p}"] = full[:p]
+    return fields
+
+
+def covering_cells(lat, lng, radius_km):
+    """(precision, cells) whose union covers the circle. Uses the finest
+    precision that needs no more than MAX_CELLS_PER_QUERY cells."""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    d_lng = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+    south, north = max(lat - d_lat, -90.0), min(lat + d_lat, 90.0)
+    west, east = lng - d_lng, lng + d_lng
+    best = (QUERY_PRECISIONS[0], None)
+    for p in QUERY_PRECISIONS:
+        step_lat, step_lng = cell_size_deg(p)
+        rows = int((north - south) / step_lat) + 2
+        cols = int((east - west) / step_lng) + 2
+        if rows * cols > 4 * MAX_CELLS_PER_QUERY:
+            break
+        cells = set()
+        for i in range(rows):
+            y = min(south + i * step_lat, north)
+            for j in range(cols):
+                x = min(west + j * step_lng, east)
+                cells.add(encode(y, (x + 180.0) % 360.0 - 180.0, p))
+        if len(cells) > MAX_CELLS_PER_QUERY:
+            break
+        best = (p, cells)
+    if best[1] is None:
+        p = QUERY_PRECISIONS[0]
+        best = (p, {encode(lat, lng, p)})
+    return best[0], sorted(best[1])
+
+
+def stream_events_near(collection, lat, lng, radius_km):
+    """Documents in the geohash cells covering the circle (a superset of it)."""
+    precision, cells = covering_cells(lat, lng, radius_km)
+    for start in range(0, len(cells), MAX_CELLS_PER_QUERY):
+        chunk = cells[start:start + MAX_CELLS_PER_QUERY]
+        yield from collection.where(filter=FieldFilter(f"geohash_{precision}", "in", chunk)).stream()
+
+
+if __name__ == "__main__":
+    # FIRESTORE_EMULATOR_HOST=localhost:8080 python geo.py --backfill
+    if "--backfill" in sys.argv:
+        from google.cloud import firestore
+        from event_fields import backfill  # deferred: event_fields imports geo
+
+        backfill(firestore.Client())
@@ -0,0 +1,62 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest side in pixels. "display" feeds Gemini vision and the map/feed,
+# "thumbnail" is for lists and markers.
+DISPLAY_MAX_SIDE = int(os.environ.get("IMAGE_DISPLAY_MAX_SIDE", "1024"))
+THUMBNAIL_MAX_SIDE = int(os.environ.get("IMAGE_THUMBNAIL_MAX_SIDE", "320"))
+DISPLAY_QUALITY = 82
+THUMBNAIL_QUALITY = 70
+HASH_SIZE = 8  # dHash of HASH_SIZE x HASH_SIZE bits
+
+
+def dhash(img):
+    """64-bit difference hash as 16 hex chars: robust to rescaling and re-encoding,
+    so two photos of the same scene from the same phone/angle land a few bits apart."""
+    small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def _jpeg(img, max_side, quality):
+    resized = img.copy()
+    resized.thumbnail((max_side, max_side), Image.LANCZOS)
+    buf = BytesIO()
+    resized.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def make_variants(fileobj):
+    """Upright, downscaled JPEG variants of an uploaded photo plus its perceptual hash:
+    {"display": bytes, "thumbnail": bytes, "hash": str}, or None if Pillow
+    cannot read it (callers then fall back to the original)."""
+    fileobj.seek(0)
+    try:
+        with Image.open(fileobj) as img:
+            # Let the JPEG decoder downscale by 1/2..1/8 while decoding; never below DISPLAY_MAX_SIDE.
+            img.draft("RGB", (DISPLAY_MAX_SIDE, DISPLAY_MAX_SIDE))
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            return {
+                "display": _jpeg(img, DISPLAY_MAX_SIDE, DISPLAY_QUALITY),
+                "thumbnail": _jpeg(img, THUMBNAIL_MAX_SIDE, THUMBNAIL_QUALITY),
+                "hash": dhash(img),
+            }
+    except (UnidentifiedImageError, OSError) as e:
+        print(f"⚠️ Could not process image: {e}")
+        return None
+    finally:
+        fileobj.seek(0)
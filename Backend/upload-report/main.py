@@ -5,10 +5,15 @@ from google.cloud import storage, firestore
 import uuid
 import os
 import json
-from fastapi import FastAPI, Query
+import heapq
+import asyncio
+from fastapi import FastAPI, Query, HTTPException
 from typing import List, Dict, Any
 from google.cloud import firestore
-import math
+from geo import geohash_fields, haversine, stream_events_near
+from event_cache import EventCache, event_time, parse_time, recency_fields
+from event_fields import FieldFiller
+from uploads import store_images, run_blocking
 
 
 app = FastAPI()
@@ -17,6 +22,32 @@ storage_client = storage.Client()
 bucket = storage_client.bucket(BUCKET_NAME)
 db = firestore.Client()
 
+# Resident index of recent events for /events-nearby (see event_cache.py).
+EVENT_CACHE_ENABLED = os.environ.get("EVENT_CACHE_ENABLED", "true").lower() == "true"
+EVENT_CACHE_CAPACITY = int(os.environ.get("EVENT_CACHE_CAPACITY", "50000"))
+EVENT_CACHE_MAX_AGE_HOURS = float(os.environ.get("EVENT_CACHE_MAX_AGE_HOURS", "168"))
+event_cache = EventCache(EVENT_CACHE_CAPACITY, EVENT_CACHE_MAX_AGE_HOURS * 3600)
+# Feed events are written elsewhere without geohash/recency fields; fill them in
+# so they show up in nearby queries and the cache (see event_fields.py).
+EVENT_FIELD_FILLER_ENABLED = os.environ.get("EVENT_FIELD_FILLER_ENABLED", "true").lower() == "true"
+field_filler = FieldFiller(db)
+
+
+@app.on_event("startup")
+def start_event_cache():
+    if EVENT_FIELD_FILLER_ENABLED:
+        field_filler.start()
+    if EVENT_CACHE_ENABLED:
+        if not EVENT_FIELD_FILLER_ENABLED:
+            print("⚠️ Event field filler disabled: events written without event_ts stay out of the cache")
+        event_cache.start(db.collection("events"))
+
+
+@app.on_event("shutdown")
+def stop_event_cache():
+    event_cache.stop()
+    field_filler.stop()
+
 @app.post("/report-incident")
 async def report_incident(
     description: str = Form(...),
@@ -26,27 +57,26 @@ async def report_incident(
     images: Optional[List[UploadFile]] = File(None)
 ):
     report_id = str(uuid.uuid4())
-    image_urls = []
+    stored = []
 
     try:
         parsed_location = json.loads(location)  # parses JSON string to dict
 
         if images:
-            for image in images:
-                image.file.seek(0)
-                blob = bucket.blob(f'incidents/{report_id}/{image.filename}')
-                blob.upload_from_file(image.file, content_type=image.content_type)
-                blob.make_public()
-                image_urls.append(blob.public_url)
-
-        db.collection("events").document(report_id).set({
+            stored = await store_images(bucket, report_id, images)
+
+        await run_blocking(db.collection("events").document(report_id).set, {
             "description": description,
             "event_type": event_type,
             "lat": parsed_location.get("latitude"),
             "lng": parsed_location.get("longitude"),
             "timestamp": timestamp,
-            "image_urls": image_urls,
+            "image_urls": [s["original"] for s in stored],
+            "display_urls": [s["display"] for s in stored],
+            "thumbnail_urls": [s["thumbnail"] for s in stored],
             "report_id": report_id,
+            **geohash_fields(parsed_location.get("latitude"), parsed_location.get("longitude")),
+            **recency_fields({"timestamp": timestamp}),
         })
 
         return {"status": "success", "report_id": report_id}
@@ -54,7 +84,151 @@ async def report_incident(
     except Exception as e:
         print("🚨 Error:", str(e))
         return {"status": "fail", "error": str(e)}
-    
+
+
+# === Bulk submission ===
+# Phones queue reports while offline and sync them in one request. Each report
+# carries a client-generated idempotency key; its document id is derived from
+# that key, so a retried sync finds the reports it already stored instead of
+# creating duplicates.
+BULK_MAX_REPORTS = int(os.environ.get("BULK_MAX_REPORTS", "50"))
+FIRESTORE_BATCH_SIZE = 400  # Firestore allows 500 writes per batch
+REPORT_ID_NAMESPACE = uuid.UUID("6f1c2a52-9d0e-4b8e-8a43-2f5de0c7b1a4")
+
+
+def report_id_for(client_key: str) -> str:
+    return str(uuid.uuid5(REPORT_ID_NAMESPACE, client_key))
+
+
+def existing_report_ids(report_ids):
+    """The subset of report_ids that already have a document."""
+    refs = [db.collection("events").document(report_id) for report_id in report_ids]
+    return {snapshot.id for snapshot in db.get_all(refs) if snapshot.exists}
+
+
+def commit_reports(docs):
+    """Write {report_id: document} with as few batched commits as possible."""
+    items = list(docs.items())
+    for start in range(0, len(items), FIRESTORE_BATCH_SIZE):
+        batch = db.batch()
+        for report_id, doc in items[start:start + FIRESTORE_BATCH_SIZE]:
+            batch.set(db.collection("events").document(report_id), doc)
+        batch.commit()
+
+
+def is_coordinate(value, limit):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and -limit <= value <= limit
+
+
+def entry_error(entry, location, indices, image_count, claimed):
+    """Why a bulk entry cannot be stored, or None if it is valid."""
+    for field in ("description", "event_type"):
+        if not isinstance(entry.get(field), str):
+            return f"{field} is required"
+    timestamp = entry.get("timestamp")
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (str, int, float)) or timestamp == "":
+        return "timestamp is required"
+    if not isinstance(location, dict):
+        return "Invalid location"
+    lat, lng = location.get("latitude"), location.get("longitude")
+    if not (lat is None and lng is None) and not (is_coordinate(lat, 90) and is_coordinate(lng, 180)):
+        return "location needs numeric latitude and longitude"
+    if not isinstance(indices, list) or any(
+            not isinstance(i, int) or isinstance(i, bool) or not 0 <= i < image_count or i in claimed
+            for i in indices):
+        return "Invalid image index"
+    return None
+
+
+@app.post("/report-incidents/batch")
+async def report_incidents_batch(
+    reports: str = Form(...),
+    images: Optional[List[UploadFile]] = File(None)
+):
+    """Store many reports at once.
+
+    `reports` is a JSON list of {"client_key", "description", "event_type",
+    "location": {"latitude", "longitude"}, "timestamp", "images": [i, ...]},
+    where "images" are indices into the uploaded `images` files (each file
+    belongs to one report). Returns one result per report, in order, with
+    status "created", "exists" (stored by an earlier attempt) or "fail"."""
+    try:
+        entries = json.loads(reports)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=422, detail="reports must be a JSON list")
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=422, detail="reports must be a JSON list")
+    if len(entries) > BULK_MAX_REPORTS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_REPORTS} reports per request")
+    images = images or []
+
+    results, accepted, claimed = [], {}, set()
+    for entry in entries:
+        client_key = entry.get("client_key") if isinstance(entry, dict) else None
+        if not client_key:
+            results.append({"client_key": client_key, "status": "fail", "error": "client_key is required"})
+            continue
+        report_id = report_id_for(str(client_key))
+        result = {"client_key": client_key, "report_id": report_id}
+        results.append(result)
+        indices = entry.get("images") or []
+        location = entry.get("location") or {}
+        error = entry_error(entry, location, indices, len(images), claimed)
+        if report_id in accepted:
+            result["status"] = "exists"  # same key twice in one request
+        elif error:
+            result.update(status="fail", error=error)
+        else:
+            claimed.update(indices)
+            accepted[report_id] = (entry, location, indices, result)
+
+    try:
+        existing = await run_blocking(existing_report_ids, list(accepted)) if accepted else set()
+        for report_id in existing:
+            accepted.pop(report_id)[3]["status"] = "exists"
+
+        # Upload every new report's images concurrently; paths are per report_id,
+        # so a retry overwrites the same objects rather than adding new ones.
+        stored_per_report = await asyncio.gather(*(
+            store_images(bucket, report_id, [images[i] for i in indices])
+            for report_id, (_, _, indices, _) in accepted.items()
+        ), return_exceptions=True)
+
+        docs = {}
+        for (report_id, (entry, location, _, result)), stored in zip(list(accepted.items()), stored_per_report):
+            if isinstance(stored, Exception):
+                result.update(status="fail", error=str(stored))
+                del accepted[report_id]
+                continue
+            lat, lng = location.get("latitude"), location.get("longitude")
+            docs[report_id] = {
+                "description": entry["description"],
+                "event_type": entry["event_type"],
+                "lat": lat,
+                "lng": lng,
+                "timestamp": str(entry["timestamp"]),
+                "image_urls": [s["original"] for s in stored],
+                "display_urls": [s["display"] for s in stored],
+                "thumbnail_urls": [s["thumbnail"] for s in stored],
+                "report_id": report_id,
+                "client_key": entry["client_key"],
+                **geohash_fields(lat, lng),
+                **recency_fields(entry),
+            }
+        await run_blocking(commit_reports, docs)
+        for _, _, _, result in accepted.values():
+            result["status"] = "created"
+    except Exception as e:
+        print("🚨 Bulk submission error:", str(e))
+        for _, _, _, result in accepted.values():
+            result.update(status="fail", error=str(e))
+
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(f"📦 Bulk submission of {len(results)} reports: {counts}")
+    return {"status": "success", "results": results}
+
 
 
 
@@ -99,50 +273,78 @@ async def report_incident(
 
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in km
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    d_phi = math.radians(lat2 - lat1)
-    d_lambda = math.radians(lon2 - lon1)
+NEARBY_RADIUS_KM = 50
+NEARBY_DEFAULT_LIMIT = 100
+NEARBY_MAX_LIMIT = 500
+
+
+def firestore_events_near(latitude, longitude, radius_km):
+    """[(distance_km, event dict), ...] within radius_km from a geohash query;
+    used while the resident cache is not warm. Blocking."""
+    matches = []
+    for doc in stream_events_near(db.collection("events"), latitude, longitude, radius_km):
+        data = doc.to_dict()
+        if data.get("lat") is not None and data.get("lng") is not None:
+            distance = haversine(latitude, longitude, data["lat"], data["lng"])
+            if distance <= radius_km:
+                matches.append((distance, data))
+    return matches
 
-    a = math.sin(d_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
-    return R * c  # distance in kilometers
+def event_kind(data):
+    """Feed events carry `type`, citizen reports `event_type`."""
+    return data.get("type") or data.get("event_type") or "unknown"
+
 
 @app.get("/events-nearby")
 async def get_events_nearby(
     latitude: float = Query(..., description="Your current latitude"),
-    longitude: float = Query(..., description="Your current longitude")
+    longitude: float = Query(..., description="Your current longitude"),
+    radius_km: float = Query(NEARBY_RADIUS_KM, gt=0, le=NEARBY_RADIUS_KM, description="Search radius in km"),
+    types: Optional[List[str]] = Query(None, description="Only these event types (repeatable)"),
+    since: Optional[str] = Query(None, description="Only events at or after this ISO time / epoch"),
+    limit: int = Query(NEARBY_DEFAULT_LIMIT, ge=1, le=NEARBY_MAX_LIMIT, description="Nearest k events")
 ) -> List[Dict[str, Any]]:
+    since_ts = None
+    if since is not None:
+        since_ts = parse_time(since)
+        if since_ts is None:
+            raise HTTPException(status_code=422, detail="since must be an ISO datetime or epoch time")
+    wanted = set(types) if types else None
+
     try:
-        events_ref = db.collection("events").stream()
+        if event_cache.ready.is_set():
+            nearby = event_cache.near(latitude, longitude, radius_km)
+        else:
+            nearby = await run_blocking(firestore_events_near, latitude, longitude, radius_km)
+        # Filter before building any response dicts, then keep only the k nearest (bounded heap).
+        # With `since`, undated events are left out.
+        matches = (
+            (distance, data)
+            for distance, data in nearby
+            if (wanted is None or event_kind(data) in wanted)
+            and (since_ts is None or ((ts := event_time(data)) is not None and ts >= since_ts))
+        )
+        nearest = heapq.nsmallest(limit, matches, key=lambda match: match[0])
+
         results_by_type = {}
+        for distance, data in nearest:
+            event_type = event_kind(data)
+            event_info = {
+                "datetime": data.get("datetime"),
+                "lat": data.get("lat"),
+                "lng": data.get("lng"),
+                "location": data.get("location"),
+                "link": data.get("link"),
+                "title": data.get("title"),
+                "type": event_type,
+                "distance_km": round(distance, 3),
+            }
+
+            if event_type not in results_by_type:
+                results_by_type[event_type] = []
 
-        for doc in events_ref:
-            data = doc.to_dict()
-            event_lat = data.get("lat")
-            event_lng = data.get("lng")
-
-            if event_lat is not None and event_lng is not None:
-                distance = haversine(latitude, longitude, event_lat, event_lng)
-                if distance <= 50:
-                    event_type = data.get("type", "unknown")
-                    event_info = {
-                        "datetime": data.get("datetime"),
-                        "lat": event_lat,
-                        "lng": event_lng,
-                        "location": data.get("location"),
-                        "link": data.get("link"),
-                        "title": data.get("title"),
-                        "type": event_type
-                    }
-
-                    if event_type not in results_by_type:
-                        results_by_type[event_type] = []
-
-                    results_by_type[event_type].append(event_info)
+            results_by_type[event_type].append(event_info)
 
         response = [{"type": t, "events": evts} for t, evts in results_by_type.items()]
         return response
@@ -1,12 +1,19 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from typing import List, Optional
 from google.cloud import storage, firestore
 from google.oauth2 import service_account
 import uuid
 import os
 import json
+import time
 import base64
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud.firestore_v1.base_query import FieldFilter
+from geo import geohash_fields
+from event_cache import recency_fields
+from uploads import store_images, run_blocking
+from photo_index import PhotoHashIndex
 
 app = FastAPI()
 
@@ -22,31 +29,76 @@ if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY environment variable not set.")
 
 GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
+GEMINI_TIMEOUT_S = float(os.environ.get("GEMINI_TIMEOUT_S", "60"))
 
-def call_gemini_vision(base64_image: str) -> dict:
-    """Send the image to Gemini multimodal and return structured summary"""
+# Vision analysis runs in the background on this pool; reports are answered
+# as soon as they are stored and the app polls /reports/{report_id}.
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "4"))
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="vision")
+# Reports whose analysis was queued or started longer ago than this are taken
+# to be lost with a stopped instance and are queued again at startup.
+ANALYSIS_LEASE_S = float(os.environ.get("ANALYSIS_LEASE_MINUTES", "10")) * 60
+# Recently analyzed photos; a near-identical photo nearby reuses their analysis.
+photo_index = PhotoHashIndex(db.collection("events"))
+
+# One vision request per report covers all of its photos. Past these limits
+# photos fall back to their thumbnail and then are left out of the analysis
+# (they are still stored with the report). The budget counts raw bytes; the
+# base64 request body is about 4/3 of it, well under Gemini's inline limit.
+VISION_MAX_IMAGES = int(os.environ.get("VISION_MAX_IMAGES", "6"))
+VISION_MAX_BYTES = int(os.environ.get("VISION_MAX_BYTES", str(4 * 1024 * 1024)))
+
+VISION_PROMPT = (
+    "These {count} photo(s) were submitted together as one incident report. "
+    "What incident do they show? Describe the situation, categorize the event type "
+    "(e.g., fire, protest, accident), and give a short summary. Answer with one line "
+    "'Event type: <type>' followed by one line 'Description: <summary>'."
+)
+
+
+def select_vision_images(stored: list, images: list):
+    """[(mime_type, bytes, blob path), ...] to analyze, within VISION_MAX_IMAGES
+    and VISION_MAX_BYTES, plus the number of photos left out.
+
+    Each photo goes in as its display variant if that fits the remaining
+    budget, else as its thumbnail, else not at all. Photos Pillow could not
+    read have no variants and are only sent as the original if it fits."""
+    selected, used = [], 0
+    for item, image in zip(stored, images):
+        if len(selected) == VISION_MAX_IMAGES:
+            break
+        paths = item["paths"]
+        if item["vision_bytes"] is not None:
+            candidates = [("image/jpeg", item["vision_bytes"], paths["display"]),
+                          ("image/jpeg", item["thumbnail_bytes"], paths["thumbnail"])]
+        else:
+            image.file.seek(0)
+            candidates = [(image.content_type or "image/jpeg", image.file.read(), paths["original"])]
+        for mime_type, data, path in candidates:
+            if used + len(data) <= VISION_MAX_BYTES:
+                selected.append((mime_type, data, path))
+                used += len(data)
+                break
+    return selected, len(stored) - len(selected)
+
+
+def call_gemini_vision(vision_images: list) -> dict:
+    """Send the report's images, [(mime_type, base64 data), ...], to Gemini
+    multimodal in one request and return its structured summary"""
     headers = {
         "Content-Type": "application/json"
     }
+    parts = [{"inline_data": {"mime_type": mime_type, "data": data}} for mime_type, data in vision_images]
+    parts.append({"text": VISION_PROMPT.format(count=len(vision_images))})
     payload = {
         "contents": [
             {
-                "parts": [
-                    {
-                        "inline_data": {
-                            "mime_type": "image/jpeg",  # Assuming JPEG, adjust if needed
-                            "data": base64_image
-                        }
-                    },
-                    {
-                        "text": "What incident does this image show? Describe the situation, categorize the event type (e.g., fire, protest, accident), and give a short summary."
-                    }
-                ]
+                "parts": parts
             }
         ]
     }
     try:
-        response = requests.post(GEMINI_API_URL, headers=headers, json=payload)
+        response = requests.post(GEMINI_API_URL, headers=headers, json=payload, timeout=GEMINI_TIMEOUT_S)
         response.raise_for_status()  # Raise an exception for bad status codes
         result = response.json()
         return result
@@ -54,6 +106,129 @@ def call_gemini_vision(base64_image: str) -> dict:
         print(f"Error calling Gemini API: {e}")
         raise  # Re-raise the exception to be handled by the caller
 
+def parse_vision_result(gemini_result: dict):
+    """(event_type, description) from a Gemini generateContent response."""
+    description = "N/A"
+    event_type = "unknown"
+    if gemini_result and "candidates" in gemini_result and gemini_result["candidates"]:
+        if gemini_result["candidates"][0]["content"]["parts"]:
+            text = gemini_result["candidates"][0]["content"]["parts"][0]["text"]
+            # Improved parsing of Gemini's response
+            lines = text.strip().split('\n')
+            description_parts = []
+            for line in lines:
+                lower_line = line.lower()
+                if lower_line.startswith("description:"):
+                    description_parts.append(line.split(":", 1)[1].strip())
+                elif lower_line.startswith("event type:"):
+                    event_type = line.split(":", 1)[1].strip().lower()
+                    # Normalize common variations
+                    if event_type in ["fire", "fires"]:
+                        event_type = "fire"
+                    elif event_type in ["protest", "protests", "demonstration"]:
+                        event_type = "protest"
+                    elif event_type in ["accident", "car accident", "vehicle accident"]:
+                        event_type = "accident"
+                    else:
+                        event_type = "other" # Default for unclassified
+                else:
+                    # Assume general description parts if not specifically labeled
+                    description_parts.append(line.strip())
+
+            description = " ".join(description_parts)
+            # Fallback for event type if Gemini didn't explicitly classify
+            if event_type == "unknown" or event_type == "other":
+                if "fire" in description.lower():
+                    event_type = "fire"
+                elif "protest" in description.lower():
+                    event_type = "protest"
+                elif "accident" in description.lower() or "crash" in description.lower():
+                    event_type = "accident"
+                else:
+                    event_type = "general" # A catch-all if still no category
+
+        else:
+            description = "Gemini API did not return any text content."
+    else:
+        description = "Gemini API did not return expected candidates."
+        print(f"Unexpected Gemini response structure: {gemini_result}")
+    return event_type, description
+
+
+def share_with_linked(doc_ref, fields: dict):
+    """Copy an analysis outcome onto the reports linked to this one as duplicates."""
+    linked = (doc_ref.get().to_dict() or {}).get("linked_reports", [])
+    if not linked:
+        return
+    batch = db.batch()
+    for linked_id in linked:
+        batch.update(db.collection("events").document(linked_id), fields)
+    batch.commit()
+
+
+def load_vision_images(data: dict):
+    """The report's analysis inputs re-read from Cloud Storage, [(mime_type, base64 data), ...]."""
+    inputs = data.get("vision_inputs") or []
+    if not inputs:
+        raise ValueError("No images within the analysis limit")
+    return [(i["mime_type"], base64.b64encode(bucket.blob(i["path"]).download_as_bytes()).decode("utf-8"))
+            for i in inputs]
+
+
+@firestore.transactional
+def claim_analysis(transaction, doc_ref):
+    """Move a pending report to processing; returns its data, or None if it is
+    not pending (already analyzed, or taken by another worker)."""
+    data = doc_ref.get(transaction=transaction).to_dict() or {}
+    if data.get("analysis_status") != "pending":
+        return None
+    transaction.update(doc_ref, {"analysis_status": "processing", "analysis_started_at": time.time()})
+    return data
+
+
+def analyze_report(report_id: str, vision_images: list = None):
+    """Background job: run vision analysis over the report's images (re-read
+    from Cloud Storage when not given) and write the result onto the report
+    and onto any duplicates linked to it meanwhile. If it fails, those
+    duplicates are analyzed on their own instead."""
+    doc_ref = db.collection("events").document(report_id)
+    try:
+        data = claim_analysis(db.transaction(), doc_ref)
+        if data is None:
+            return
+        if vision_images is None:
+            vision_images = load_vision_images(data)
+        event_type, description = parse_vision_result(call_gemini_vision(vision_images))
+        result = {"event_type": event_type, "description": description}
+        doc_ref.update({**result, "analysis_status": "done", "analyzed_at": firestore.SERVER_TIMESTAMP})
+        share_with_linked(doc_ref, {**result, "analysis_status": "reused"})
+        print(f"🔎 Analyzed report {report_id}: {event_type}")
+    except Exception as e:
+        print(f"🚨 Analysis of report {report_id} failed: {e}")
+        photo_index.discard(report_id)
+        doc_ref.update({"analysis_status": "failed", "analysis_error": str(e)})
+        for linked_id in (doc_ref.get().to_dict() or {}).get("linked_reports", []):
+            analysis_executor.submit(analyze_report, linked_id)
+
+
+def link_duplicate(report_id: str, original_id: str):
+    """Attach a duplicate report to the original and take over its analysis if
+    already finished, or analyze it on its own if the original's failed.
+    Linking happens before the status check, and the analyzer reads the links
+    after writing its outcome, so neither side can miss the other."""
+    original_ref = db.collection("events").document(original_id)
+    original_ref.update({"linked_reports": firestore.ArrayUnion([report_id])})
+    original = original_ref.get().to_dict() or {}
+    if original.get("analysis_status") in ("done", "reused"):
+        db.collection("events").document(report_id).update({
+            "event_type": original.get("event_type"),
+            "description": original.get("description"),
+            "analysis_status": "reused",
+        })
+    elif original.get("analysis_status") == "failed":
+        analysis_executor.submit(analyze_report, report_id)
+
+
 @app.post("/report-incident")
 async def report_incident(
     location: str = Form(...),
@@ -62,8 +237,6 @@ async def report_incident(
 ):
     report_id = str(uuid.uuid4())
     image_urls = []
-    description = "N/A"
-    event_type = "unknown"
 
     try:
         parsed_location = json.loads(location)
@@ -71,99 +244,126 @@ async def report_incident(
         if not images:
             return {"status": "fail", "error": "At least one image is required."}
 
-        # Process only the first image for analysis
-        first_image = images[0]
-
-        # Upload image to Google Cloud Storage
-        blob = bucket.blob(f'incidents/{report_id}/{first_image.filename}')
-        first_image.file.seek(0)  # Reset before upload
-        blob = bucket.blob(f'incidents/{report_id}/{first_image.filename}')
-        blob.upload_from_file(first_image.file, content_type=first_image.content_type)
-        blob.make_public()
-        image_url = blob.public_url
-        image_urls.append(image_url)
-
-        # await blob.upload_from_file(first_image.file, content_type=first_image.content_type)
-        # await blob.make_public()
-        # image_url = blob.public_url
-        # image_urls.append(image_url)
-
-        # Reset file pointer for reading image bytes for Gemini
-        first_image.file.seek(0)
-        image_bytes = first_image.file.read()
-        base64_image = base64.b64encode(image_bytes).decode("utf-8")
-
-        # Call Gemini Vision
-        gemini_result = call_gemini_vision(base64_image)
-
-        if gemini_result and "candidates" in gemini_result and gemini_result["candidates"]:
-            if gemini_result["candidates"][0]["content"]["parts"]:
-                text = gemini_result["candidates"][0]["content"]["parts"][0]["text"]
-                # Improved parsing of Gemini's response
-                lines = text.strip().split('\n')
-                description_parts = []
-                for line in lines:
-                    lower_line = line.lower()
-                    if lower_line.startswith("description:"):
-                        description_parts.append(line.split(":", 1)[1].strip())
-                    elif lower_line.startswith("event type:"):
-                        event_type = line.split(":", 1)[1].strip().lower()
-                        # Normalize common variations
-                        if event_type in ["fire", "fires"]:
-                            event_type = "fire"
-                        elif event_type in ["protest", "protests", "demonstration"]:
-                            event_type = "protest"
-                        elif event_type in ["accident", "car accident", "vehicle accident"]:
-                            event_type = "accident"
-                        else:
-                            event_type = "other" # Default for unclassified
-                    else:
-                        # Assume general description parts if not specifically labeled
-                        description_parts.append(line.strip())
+        # Upload all images to Google Cloud Storage concurrently (off the event loop)
+        stored = await store_images(bucket, report_id, images)
+        image_urls = [item["original"] for item in stored]
 
-                description = " ".join(description_parts)
-                # Fallback for event type if Gemini didn't explicitly classify
-                if event_type == "unknown" or event_type == "other":
-                    if "fire" in description.lower():
-                        event_type = "fire"
-                    elif "protest" in description.lower():
-                        event_type = "protest"
-                    elif "accident" in description.lower() or "crash" in description.lower():
-                        event_type = "accident"
-                    else:
-                        event_type = "general" # A catch-all if still no category
+        # All photos go to Gemini in one request, as downscaled variants within the budget
+        selected, skipped = select_vision_images(stored, images)
+        if skipped:
+            print(f"⚠️ Report {report_id}: {skipped} of {len(stored)} images left out of analysis")
+        vision_images = [(mime_type, base64.b64encode(data).decode("utf-8")) for mime_type, data, _ in selected]
+        image_hash = next((item["hash"] for item in stored if item["hash"]), None)
 
-            else:
-                description = "Gemini API did not return any text content."
-        else:
-            description = "Gemini API did not return expected candidates."
-            print(f"Unexpected Gemini response structure: {gemini_result}")
+        lat, lng = parsed_location.get("latitude"), parsed_location.get("longitude")
+        duplicate_of = await run_blocking(photo_index.find, image_hash, lat, lng)
 
+        # Nothing fits the vision budget and nothing to reuse: keep the report, just without analysis.
+        analysis_status = "pending" if selected or duplicate_of else "failed"
 
-        # Save to Firestore
+        # Save to Firestore; analysis fills in event_type and description later
         doc_ref = db.collection("events").document(report_id)
-        doc_ref.set({
-            "description": description,
-            "event_type": event_type,
+        await run_blocking(doc_ref.set, {
+            "description": "N/A",
+            "event_type": "unknown",
+            "analysis_status": analysis_status,
+            "analysis_error": None if analysis_status == "pending" else f"Images exceed the {VISION_MAX_BYTES} byte analysis limit",
             "lat": parsed_location.get("latitude"),
             "lng": parsed_location.get("longitude"),
             "timestamp": timestamp,
             "image_urls": image_urls,
+            "display_urls": [item["display"] for item in stored],
+            "thumbnail_urls": [item["thumbnail"] for item in stored],
+            "analyzed_images": len(selected),
+            "vision_inputs": [{"mime_type": mime_type, "path": path} for mime_type, _, path in selected],
+            "analysis_queued_at": time.time(),
             "report_id": report_id,
+            "image_hash": image_hash,
+            "image_hashed_at": time.time() if image_hash else None,
+            "duplicate_of": duplicate_of,
+            **geohash_fields(lat, lng),
+            **recency_fields({"timestamp": timestamp}),
         })
 
-        return {"status": "success", "report_id": report_id, "event_type": event_type, "description": description, "image_urls": image_urls}
+        if duplicate_of:
+            # Same scene photographed nearby moments ago: reuse that analysis, no vision call.
+            print(f"♻️ Report {report_id} duplicates photo of {duplicate_of}")
+            await run_blocking(link_duplicate, report_id, duplicate_of)
+        elif selected:
+            analysis_executor.submit(analyze_report, report_id, vision_images)
+            if image_hash:
+                photo_index.add(image_hash, lat, lng, report_id)
+
+        return {"status": "accepted", "report_id": report_id,
+                "analysis_status": analysis_status, "duplicate_of": duplicate_of,
+                "analyzed_images": len(selected), "image_urls": image_urls,
+                "thumbnail_urls": [item["thumbnail"] for item in stored]}
 
     except json.JSONDecodeError:
         print("🚨 Error: Invalid JSON format for location.")
         return {"status": "fail", "error": "Invalid JSON format for location."}
-    except requests.exceptions.RequestException as e:
-        print(f"🚨 Error communicating with Gemini API: {e}")
-        return {"status": "fail", "error": f"Gemini API error: {e}"}
     except Exception as e:
         print(f"🚨 An unexpected error occurred: {e}")
         return {"status": "fail", "error": str(e)}
 
+
+@app.get("/reports/{report_id}")
+async def get_report_status(report_id: str):
+    """Analysis status of a report, with its result once done."""
+    snapshot = await run_blocking(db.collection("events").document(report_id).get)
+    if not snapshot.exists:
+        raise HTTPException(status_code=404, detail="Report not found")
+    data = snapshot.to_dict()
+    status = data.get("analysis_status", "done")
+    response = {"report_id": report_id, "analysis_status": status, "duplicate_of": data.get("duplicate_of")}
+    if status in ("done", "reused"):
+        response.update(event_type=data.get("event_type"), description=data.get("description"))
+    elif status == "failed":
+        response["error"] = data.get("analysis_error")
+    return response
+
+
+@firestore.transactional
+def requeue_if_stale(transaction, doc_ref, cutoff):
+    """Put a report whose analysis lease ran out back to pending; returns its
+    data, or None if it is not stale."""
+    data = doc_ref.get(transaction=transaction).to_dict() or {}
+    status = data.get("analysis_status")
+    leased_at = data.get("analysis_started_at") if status == "processing" else data.get("analysis_queued_at")
+    if status not in ("pending", "processing") or (leased_at or 0) >= cutoff:
+        return None
+    transaction.update(doc_ref, {"analysis_status": "pending", "analysis_queued_at": time.time()})
+    return data
+
+
+@app.on_event("startup")
+def requeue_stale_analyses():
+    """Queue again the analyses a stopped instance left pending or processing."""
+    cutoff = time.time() - ANALYSIS_LEASE_S
+    requeued = 0
+    try:
+        stale = db.collection("events").where(filter=FieldFilter("analysis_status", "in", ["pending", "processing"]))
+        for snapshot in stale.stream():
+            data = requeue_if_stale(db.transaction(), snapshot.reference, cutoff)
+            if data is None:
+                continue
+            requeued += 1
+            if data.get("duplicate_of"):
+                # Takes over the original's result if it finished meanwhile.
+                analysis_executor.submit(link_duplicate, snapshot.id, data["duplicate_of"])
+            else:
+                analysis_executor.submit(analyze_report, snapshot.id)
+    except Exception as e:
+        print(f"🚨 Re-queueing stale analyses failed: {e}")
+    if requeued:
+        print(f"♻️ Re-queued {requeued} stale report analyses")
+
+
+@app.on_event("shutdown")
+def stop_analysis_workers():
+    # Let in-flight analyses finish so their results reach Firestore.
+    analysis_executor.shutdown(wait=True)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
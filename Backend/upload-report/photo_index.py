@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+from collections import deque
+
+from geo import haversine, stream_events_near
+from images import hamming
+
+# A photo counts as a re-submission of an earlier one when its perceptual hash
+# is within PHOTO_MATCH_MAX_BITS of it, taken within PHOTO_MATCH_RADIUS_KM and
+# PHOTO_MATCH_WINDOW_S of it.
+PHOTO_MATCH_MAX_BITS = int(os.environ.get("PHOTO_MATCH_MAX_BITS", "10"))
+PHOTO_MATCH_RADIUS_KM = float(os.environ.get("PHOTO_MATCH_RADIUS_KM", "0.3"))
+PHOTO_MATCH_WINDOW_S = float(os.environ.get("PHOTO_MATCH_WINDOW_HOURS", "6")) * 3600
+PHOTO_INDEX_CAPACITY = 20_000
+
+
+class PhotoHashIndex:
+    """Recent photo hashes with their location and report, oldest first.
+
+    The in-process index answers most lookups. On a miss, the event documents
+    near the photo are checked (geohash query), so duplicates submitted to
+    another instance are found too. Reports whose analysis failed are never
+    matched: discard() drops them from the index, and failed documents are
+    skipped.
+    """
+
+    def __init__(self, collection, max_bits=PHOTO_MATCH_MAX_BITS, radius_km=PHOTO_MATCH_RADIUS_KM,
+                 window_s=PHOTO_MATCH_WINDOW_S, capacity=PHOTO_INDEX_CAPACITY):
+        self.collection = collection
+        self.max_bits = max_bits
+        self.radius_km = radius_km
+        self.window_s = window_s
+        self._entries = deque(maxlen=capacity)  # (hashed_at, hash, lat, lng, report_id)
+        self._lock = threading.Lock()
+
+    def add(self, image_hash, lat, lng, report_id, hashed_at=None):
+        with self._lock:
+            self._entries.append((hashed_at or time.time(), image_hash, lat, lng, report_id))
+
+    def discard(self, report_id):
+        with self._lock:
+            self._entries = deque((e for e in self._entries if e[4] != report_id), maxlen=self._entries.maxlen)
+
+    def _is_match(self, image_hash, lat, lng, other_hash, other_lat, other_lng):
+        return (
+            hamming(image_hash, other_hash) <= self.max_bits
+            and haversine(lat, lng, other_lat, other_lng) <= self.radius_km
+        )
+
+    def find(self, image_hash, lat, lng):
+        """report_id of an earlier near-identical photo taken nearby, or None."""
+        if image_hash is None or lat is None or lng is None:
+            return None
+        cutoff = time.time() - self.window_s
+        with self._lock:
+            while self._entries and self._entries[0][0] < cutoff:
+                self._entries.popleft()
+            for _, other_hash, other_lat, other_lng, report_id in reversed(self._entries):
+                if self._is_match(image_hash, lat, lng, other_hash, other_lat, other_lng):
+                    return report_id
+
+        for doc in stream_events_near(self.collection, lat, lng, self.radius_km):
+            data = doc.to_dict()
+            other_hash = data.get("image_hash")
+            if not other_hash or (data.get("image_hashed_at") or 0) < cutoff or data.get("duplicate_of"):
+                continue
+            if data.get("analysis_status") == "failed":
+                continue
+            if self._is_match(image_hash, lat, lng, other_hash, data["lat"], data["lng"]):
+                self.add(other_hash, data["lat"], data["lng"], doc.id, data["image_hashed_at"])
+                return doc.id
+        return None
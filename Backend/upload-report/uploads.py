@@ -0,0 +1,60 @@
+import os
+import asyncio
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from images import make_variants
+
+# GCS/Firestore client calls are blocking; they run on this pool so the event
+# loop stays free. Its size bounds upload parallelism for the whole worker,
+# across requests.
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "8"))
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="report-io")
+
+
+def upload_file(bucket, path, fileobj, content_type=None):
+    """Stream `fileobj` to gs://<bucket>/<path>, make it public and return its URL."""
+    fileobj.seek(0)
+    blob = bucket.blob(path)
+    blob.upload_from_file(fileobj, content_type=content_type)
+    blob.make_public()
+    return blob.public_url
+
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+async def store_image(bucket, report_id, image):
+    """Store the original upload plus its display and thumbnail variants.
+    Returns {"original", "display", "thumbnail"} URLs (variants fall back to the
+    original when the image cannot be processed), "paths", the same three as
+    blob paths, "vision_bytes" and "thumbnail_bytes", the downscaled JPEGs to
+    send to Gemini, and "hash", its perceptual hash (all None if only the
+    original exists)."""
+    variants = await run_blocking(make_variants, image.file)
+    prefix = f"incidents/{report_id}/"
+    stem = os.path.splitext(image.filename or "image")[0]
+    original_path = prefix + (image.filename or "image")
+    paths = {"original": original_path, "display": original_path, "thumbnail": original_path}
+    jobs = [run_blocking(upload_file, bucket, original_path, image.file, image.content_type)]
+    if variants:
+        for name in ("display", "thumbnail"):
+            paths[name] = f"{prefix}{stem}_{name}.jpg"
+            jobs.append(run_blocking(upload_file, bucket, paths[name], BytesIO(variants[name]), "image/jpeg"))
+    urls = await asyncio.gather(*jobs)
+    original = urls[0]
+    return {
+        "original": original,
+        "display": urls[1] if variants else original,
+        "thumbnail": urls[2] if variants else original,
+        "paths": paths,
+        "vision_bytes": variants["display"] if variants else None,
+        "thumbnail_bytes": variants["thumbnail"] if variants else None,
+        "hash": variants["hash"] if variants else None,
+    }
+
+
+async def store_images(bucket, report_id, images):
+    """store_image() for every UploadFile concurrently, in the order of `images`."""
+    return list(await asyncio.gather(*(store_image(bucket, report_id, image) for image in images)))
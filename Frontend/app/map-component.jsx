@@ -17,6 +17,17 @@ const { width, height } = Dimensions.get("window");
 const LATITUDE_DELTA = 0.05;
 const ASPECT_RATIO = width / height;
 const LONGITUDE_DELTA = LATITUDE_DELTA * ASPECT_RATIO;
+// Nearest markers fetched per request; the radius follows the visible region.
+const NEARBY_LIMIT = 60;
+const MAX_RADIUS_KM = 50;
+const KM_PER_DEGREE = 111;
+
+// Half the diagonal of the visible region, so the search circle covers the screen.
+const radiusForRegion = (latitudeDelta, longitudeDelta) => {
+  const halfHeight = (latitudeDelta * KM_PER_DEGREE) / 2;
+  const halfWidth = (longitudeDelta * KM_PER_DEGREE) / 2;
+  return Math.min(MAX_RADIUS_KM, Math.max(1, Math.hypot(halfHeight, halfWidth)));
+};
 
 // Dark theme colors
 const COLORS = {
@@ -77,10 +88,21 @@ export default function BangaloreMap() {
     return () => clearTimeout(timeoutRef.current);
   }, []);
 
-  const fetchAndAppendData = async (lat, lon) => {
+  const fetchAndAppendData = async (
+    lat,
+    lon,
+    latDelta = LATITUDE_DELTA,
+    lonDelta = LONGITUDE_DELTA
+  ) => {
     try {
-      const URL = `${API_ENDPOINT}?latitude=${lat}&longitude=${lon}`;
-      const resp = await axios.get(URL);
+      const resp = await axios.get(API_ENDPOINT, {
+        params: {
+          latitude: lat,
+          longitude: lon,
+          radius_km: radiusForRegion(latDelta, lonDelta).toFixed(2),
+          limit: NEARBY_LIMIT,
+        },
+      });
       const data = Array.isArray(resp.data) ? resp.data : [];
 
       const flat = data.flatMap((grp) => {
@@ -125,7 +147,7 @@ export default function BangaloreMap() {
     if (!mapReadyRef.current) return;
     clearTimeout(timeoutRef.current);
     timeoutRef.current = setTimeout(() => {
-      fetchAndAppendData(r.latitude, r.longitude);
+      fetchAndAppendData(r.latitude, r.longitude, r.latitudeDelta, r.longitudeDelta);
     }, 1000);
   };
 